@@ -6,3 +6,5 @@ class Constant(constant.Constant):
     DATE_FORMAT_HYPHEN = "%Y-%m-%d"
     DATE_FORMATS = [DATE_FORMAT_SLASH, DATE_FORMAT_HYPHEN]
     TIME_FORMAT = "%H:%M:%S"
+    # 1つのチャンネルの履歴を期間で分割して並行取得する際の最大分割数
+    MAX_HISTORY_SLICES = 16
@@ -1,7 +1,4 @@
-import contextlib
 import datetime
-import io
-import json
 import logging
 from typing import Optional, Dict
 
@@ -21,17 +18,37 @@ from discord_ext_commands_coghelper.utils import (
 )
 
 from cogs.constant import Constant
-from utils.misc import parse_json
+from utils.export_writer import (
+    ExportFormat,
+    RecordWriter,
+    get_export_options,
+    send_parts,
+)
+from utils.message_store import MessageStore
 
 logger = logging.getLogger(__name__)
 
+_FIELDNAMES = ["id", "author", "display_name", "created_at", "message", "edited_at"]
+
+
+def _to_jst_str(dt: datetime.datetime) -> str:
+    # 保存されている日時はUTCのnaive datetime
+    # 正式な区切り文字はTらしいが素人目では見にくいのでとりあえず半角スペースにしている
+    return (
+        dt.replace(tzinfo=datetime.timezone.utc).astimezone(Constant.JST).isoformat(" ")
+    )
+
 
 class DownloadMessageJson(discord.ext.commands.Cog, CogHelper):
     def __init__(self, bot: Bot):
         CogHelper.__init__(self, bot)
+        self._message_store = MessageStore()
         self._channel_id: Optional[int] = None
         self._before: Optional[datetime.datetime] = None
         self._after: Optional[datetime.datetime] = None
+        self._slices = 1
+        self._format = ExportFormat.JSON
+        self._compression: Optional[str] = None
 
     @command()
     async def download_messages_json(self, ctx, *args):
@@ -45,6 +62,15 @@ class DownloadMessageJson(discord.ext.commands.Cog, CogHelper):
         self._before, self._after = get_before_after_fmts(
             ctx, args, *Constant.DATE_FORMATS, tz=Constant.JST
         )
+        try:
+            self._slices = int(args.get("slice", 1))
+        except ValueError:
+            raise ArgumentError(ctx, slice="分割数の指定が正しくありません")
+        if not 1 <= self._slices <= Constant.MAX_HISTORY_SLICES:
+            raise ArgumentError(
+                ctx, slice=f"分割数は1~{Constant.MAX_HISTORY_SLICES}の範囲で指定してください"
+            )
+        self._format, self._compression = get_export_options(ctx, args)
 
     async def _execute(self, ctx: Context):
         channel = ctx.guild.get_channel(self._channel_id)
@@ -62,32 +88,40 @@ class DownloadMessageJson(discord.ext.commands.Cog, CogHelper):
         logger.debug(
             f"read messages from {channel.name} history, after={after_str} before={before_str}"
         )
-        results = []
-        async for message in channel.history(limit=None, before=before, after=after):
+        await self._message_store.sync(channel, before, after, self._slices)
+
+        writer = RecordWriter(
+            self._format, ctx.guild.filesize_limit, self._compression, _FIELDNAMES
+        )
+        # 並び順はchannel.historyに合わせてafterを指定した場合は古い順にする
+        async for message in self._message_store.iter_messages(
+            channel.id, before, after, oldest_first=after is not None
+        ):
+            # 表示名は現在のものを優先し、既にサーバーから抜けている場合は保存時のものを使う
+            member = ctx.guild.get_member(message.author_id)
             result = dict(
                 id=message.id,
-                author=message.author.name,
-                display_name=message.author.display_name,
-                created_at=message.created_at.astimezone(Constant.JST),
+                author=message.author_name,
+                display_name=member.display_name
+                if member is not None
+                else message.author_display_name,
+                created_at=_to_jst_str(message.created_at),
                 message=message.content,
             )
             if message.edited_at is not None:
-                result["edited_at"] = message.edited_at.astimezone(Constant.JST)
-            results.append(result)
+                result["edited_at"] = _to_jst_str(message.edited_at)
+            writer.write(result)
+        parts = writer.close()
 
-        filename = f"{channel.id}_messages_{after_str}_{before_str}.json".replace(
-            "/", ""
-        )
-        logger.debug(f"create {filename}")
-        with contextlib.closing(io.StringIO()) as buffer:
-            json.dump(results, buffer, default=parse_json, indent=2, ensure_ascii=False)
-            buffer.seek(0)
-            logger.debug(f"send {filename}")
-            title = "/download_messages_json"
-            description = f"集計期間: {after_str} ~ {before_str}"
-            embed = discord.Embed(title=title, description=description)
-            embed.add_field(name=f"#{channel.name}", value=channel.id)
-            await ctx.send(embed=embed, file=discord.File(buffer, filename))
+        stem = f"{channel.id}_messages_{after_str}_{before_str}".replace("/", "")
+        logger.debug(f"send {stem}{writer.extension}, parts={len(parts)}")
+        title = "/download_messages_json"
+        description = f"集計期間: {after_str} ~ {before_str}"
+        embed = discord.Embed(title=title, description=description)
+        embed.add_field(name=f"#{channel.name}", value=channel.id)
+        if len(parts) > 1:
+            embed.add_field(name="分割数", value=str(len(parts)))
+        await send_parts(ctx, parts, stem, writer.extension, embed)
 
 
 def setup(bot: Bot):
@@ -2,13 +2,23 @@ import os
 import platform
 import socket
 import sys
-from typing import Dict
+from typing import Any, Dict
 
 import discord
 from discord.ext.commands import command, Cog, Bot, Context
 
 from discord_ext_commands_coghelper import CogHelper
 
+from utils.dm_dispatcher import DMDispatcher
+from utils.gspread_client import GSpreadClient
+
+
+def _format_stats(stats: Dict[str, Any]) -> str:
+    return ", ".join(
+        f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}"
+        for key, value in stats.items()
+    )
+
 
 class GetSystemInfo(Cog, CogHelper):
     def __init__(self, bot: Bot):
@@ -37,6 +47,16 @@ class GetSystemInfo(Cog, CogHelper):
         )
         pid = os.getpid()
         embed.add_field(name="os.getpid()", value=str(pid), inline=False)
+        embed.add_field(
+            name="GSpreadClient.stats",
+            value=_format_stats(GSpreadClient().stats),
+            inline=False,
+        )
+        embed.add_field(
+            name="DMDispatcher.stats",
+            value=_format_stats(DMDispatcher().stats),
+            inline=False,
+        )
         await ctx.send(embed=embed)
 
 
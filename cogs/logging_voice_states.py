@@ -1,10 +1,12 @@
-import contextlib
+import asyncio
+import bisect
 import datetime
-import io
-import json
 import logging
 import os
-from typing import Optional, List, Dict
+import time
+from array import array
+from collections import Counter
+from typing import Callable, Optional, List, Dict, Set, Tuple
 
 import discord
 from discord.ext.commands import Bot, command, Cog, Context
@@ -19,129 +21,543 @@ from discord_ext_commands_coghelper.utils import (
     get_bool,
     get_corrected_before_after_str,
 )
+from gspread.utils import numericise_all, rowcol_to_a1
 
 from cogs.constant import Constant
 from utils.gspread_client import (
+    TEMPLATE_SHEET,
+    AsyncWorksheet,
     GSpreadClient,
-    get_or_add_worksheet,
-    duplicate_template_sheet,
+    background_priority,
 )
-from utils.misc import back_from_modified_datetime, parse_json, get_modified_datetime
+from utils.export_writer import (
+    ExportFormat,
+    RecordWriter,
+    get_export_options,
+    send_parts,
+)
+from utils.journal import Journal, JournalReplicator
+from utils.member_directory import MemberDirectory
+from utils.misc import back_from_modified_datetime, get_modified_datetime
 
 logger = logging.getLogger(__name__)
 
+_COUNT_FIELDNAMES = [
+    "user.id",
+    "user.name",
+    "channel.id",
+    "channel.name",
+    "state",
+    "count",
+]
+
+
+def _count_by_user_channel(
+    records: List[dict], state: str
+) -> Dict[int, Dict[int, int]]:
+    """レコードを1度だけ走査してユーザー毎・チャンネル毎に指定のステートを含むレコード数を集計する"""
+    # ステートの組み合わせは少ないので(ユーザー, チャンネル, ステート)の件数を数えてからまとめる
+    table = Counter(
+        (record["user_id"], record["channel_id"], str(record["state"]))
+        for record in records
+    )
+    counts: Dict[int, Dict[int, int]] = {}
+    for (user_id, channel_id, record_state), count in table.items():
+        if state not in record_state:
+            continue
+        user_counts = counts.setdefault(user_id, {})
+        user_counts[channel_id] = user_counts.get(channel_id, 0) + count
+    return counts
+
+
+_DURATION_FIELDNAMES = [
+    "user.id",
+    "user.name",
+    "channel.id",
+    "channel.name",
+    "sessions",
+    "voice",
+    "stream",
+    "video",
+]
+# 区間の種類毎の開始と終了のステート ※ボイスチャンネルの参加はjoin/move/leaveで扱う
+_SPAN_STATES = {
+    "stream_begin": ("stream", True),
+    "stream_end": ("stream", False),
+    "video_on": ("video", True),
+    "video_off": ("video", False),
+}
+
+
+class _SessionAggregator:
+    """日時順のレコードを1件ずつ受け取り、参加・配信・カメラの区間を組み立ててユーザー毎・チャンネル毎の合計時間を集計する
+
+    区間は集計期間(start, end)の範囲に切り詰める
+    区間の種類毎に最初の記録が開始以外の場合は、集計期間の開始時点から続いていたとみなす
+    終了が記録されないまま次の区間が始まった場合はBOTの停止などで記録が抜けたとみなし、そのユーザーの最後の記録の時点で閉じる
+    集計期間の終わりの時点で続いている区間は、それより後の記録も受け取って同じように閉じる
+    """
+
+    def __init__(self, start: Optional[float], end: Optional[float]):
+        self._start = start
+        self._end = end
+        # ユーザー毎に開いている区間 {user_id: {種類: (channel_id, 開始時間)}}
+        self._spans: Dict[int, Dict[str, Tuple[int, float]]] = {}
+        self._last_seen: Dict[int, float] = {}
+        # ユーザー毎に記録を見た区間の種類
+        self._seen: Dict[int, Set[str]] = {}
+        # {user_id: {channel_id: {"sessions": 回数, "voice"/"stream"/"video": 秒数}}}
+        self.totals: Dict[int, Dict[int, Dict[str, float]]] = {}
+
+    def feed(self, timestamp: float, record: dict):
+        user_id = record["user_id"]
+        channel_id = record["channel_id"]
+        if user_id == "" or channel_id == "":
+            return
+        if self._end is not None and self._end <= timestamp:
+            # 集計期間より後の記録は、期間の終わりの時点で続いている区間を閉じるためだけに使う
+            if len(self._spans.get(user_id, {})) == 0:
+                return
+        states = str(record["state"]).split(",")
+        spans = self._spans.setdefault(user_id, {})
+        if self._start is not None:
+            self._open_implicit(user_id, channel_id, states)
+        last_seen = self._last_seen.get(user_id, timestamp)
+        for state in states:
+            if state == "join":
+                # 前回の退出が記録されていない場合は最後の記録の時点で退出したとみなす
+                for kind in list(spans.keys()):
+                    self._close(user_id, kind, last_seen)
+                spans["voice"] = (channel_id, timestamp)
+            elif state == "move":
+                self._close(user_id, "voice", timestamp)
+                spans["voice"] = (channel_id, timestamp)
+            elif state == "leave":
+                # 配信やカメラも退出時に終了する
+                for kind in list(spans.keys()):
+                    self._close(user_id, kind, timestamp)
+            elif state in _SPAN_STATES:
+                kind, begin = _SPAN_STATES[state]
+                if begin:
+                    self._close(user_id, kind, last_seen)
+                    spans[kind] = (channel_id, timestamp)
+                else:
+                    self._close(user_id, kind, timestamp)
+        self._last_seen[user_id] = timestamp
+
+    @property
+    def has_open_spans(self) -> bool:
+        return any(len(spans) > 0 for spans in self._spans.values())
+
+    def _open_implicit(self, user_id: int, channel_id: int, states: List[str]):
+        # 遡って読み込んだ範囲より前に始まった区間は最初の記録が開始以外になるので
+        # 集計期間の開始時点から続いていたとみなす
+        seen = self._seen.setdefault(user_id, set())
+        spans = self._spans[user_id]
+        # 移動の記録のチャンネルは移動先なので、移動前のチャンネルの区間は開かない
+        moved = "move" in states
+        if "voice" not in seen:
+            seen.add("voice")
+            if states[0] != "join" and not moved:
+                spans["voice"] = (channel_id, self._start)
+        for state in states:
+            if state not in _SPAN_STATES:
+                continue
+            kind, begin = _SPAN_STATES[state]
+            if kind in seen:
+                continue
+            seen.add(kind)
+            if not begin and not moved and kind not in spans:
+                # 参加より前には始まらないので参加している場合は参加の時点から
+                start = (
+                    max(self._start, spans["voice"][1])
+                    if "voice" in spans
+                    else self._start
+                )
+                spans[kind] = (channel_id, start)
+
+    def finish(self, now: float, is_active: Callable[[int, str, int], bool]):
+        """閉じていない区間を閉じる ※is_activeは(user_id, 種類, channel_id)の区間が現在も続いているかを返す"""
+        for user_id, spans in self._spans.items():
+            for kind, (channel_id, _) in list(spans.items()):
+                if is_active(user_id, kind, channel_id):
+                    end = now
+                else:
+                    end = self._last_seen[user_id]
+                self._close(user_id, kind, end)
+
+    def _close(self, user_id: int, kind: str, end: float):
+        span = self._spans[user_id].pop(kind, None)
+        if span is None:
+            return
+        channel_id, begin = span
+        if self._start is not None:
+            begin = max(begin, self._start)
+        if self._end is not None:
+            end = min(end, self._end)
+        if end <= begin:
+            return
+        user_totals = self.totals.setdefault(user_id, {})
+        if channel_id not in user_totals:
+            user_totals[channel_id] = {
+                "sessions": 0,
+                "voice": 0.0,
+                "stream": 0.0,
+                "video": 0.0,
+            }
+        user_totals[channel_id][kind] += end - begin
+        if kind == "voice":
+            user_totals[channel_id]["sessions"] += 1
+
+
+def _is_active(guild: discord.Guild, user_id: int, kind: str, channel_id: int) -> bool:
+    member = guild.get_member(user_id)
+    if member is None or member.voice is None or member.voice.channel is None:
+        return False
+    if member.voice.channel.id != channel_id:
+        return False
+    if kind == "stream":
+        return member.voice.self_stream
+    if kind == "video":
+        return member.voice.self_video
+    return True
+
+
+class _InvalidRecordError(Exception):
+    def __init__(self, record: dict):
+        super().__init__(f"invalid record: {record}")
+        self.record = record
+
+
+class _VoiceLogCache:
+    """1サーバー分のログを読み込み済みの行まで保持し、以降は追加された行だけを読み込む
+
+    最後に読み込んだ行が変わっていたりシートが縮んでいた場合は編集されたとみなして全体を読み込み直す
+    途中の行の編集は検知できないので、有効期限が切れた場合も全体を読み込み直す
+    レコードは読み込み時に日時を1度だけパースし、日時順に並べて期間を二分探索で絞り込めるようにしておく
+    """
+
+    def __init__(self, ttl: float):
+        self._ttl = ttl
+        self._header: List[str] = []
+        # 日時順のレコードと、同じ並びのUNIX時間
+        self._records: List[dict] = []
+        self._timestamps = array("d")
+        # シートから読み込んだ行数
+        self._row_count = 0
+        # 最後に読み込んだ行 ※レコードが無ければヘッダー行
+        self._last_values: List[str] = []
+        self._loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+
+    async def get_records(
+        self,
+        worksheet: AsyncWorksheet,
+        before: Optional[datetime.datetime] = None,
+        after: Optional[datetime.datetime] = None,
+    ) -> List[dict]:
+        """after < 日時 < before のレコードを日時順に返す ※before/afterはawareなdatetime"""
+        start, end = await self._find_range(worksheet, before, after)
+        return self._records[start:end]
+
+    async def get_timed_records(
+        self,
+        worksheet: AsyncWorksheet,
+        before: Optional[datetime.datetime] = None,
+        after: Optional[datetime.datetime] = None,
+    ) -> List[Tuple[float, dict]]:
+        """get_records()と同じレコードをUNIX時間と組にして返す"""
+        start, end = await self._find_range(worksheet, before, after)
+        return list(zip(self._timestamps[start:end], self._records[start:end]))
+
+    async def _find_range(
+        self,
+        worksheet: AsyncWorksheet,
+        before: Optional[datetime.datetime],
+        after: Optional[datetime.datetime],
+    ) -> Tuple[int, int]:
+        async with self._lock:
+            if (
+                self._loaded_at is None
+                or time.monotonic() - self._loaded_at > self._ttl
+                or not await self._read_new_rows(worksheet)
+            ):
+                await self._reload(worksheet)
+            start = 0
+            end = len(self._timestamps)
+            if after is not None:
+                start = bisect.bisect_right(self._timestamps, after.timestamp())
+            if before is not None:
+                end = bisect.bisect_left(self._timestamps, before.timestamp())
+            return start, end
+
+    async def _reload(self, worksheet: AsyncWorksheet):
+        values = await worksheet.get_values()
+        self._header = values[0] if len(values) > 0 else []
+        self._records = []
+        self._timestamps = array("d")
+        self._row_count = 0
+        self._last_values = self._header
+        self._append(values[1:])
+        self._loaded_at = time.monotonic()
+        logger.debug(
+            f"reload voice log, sheet={worksheet.title}, rows={self._row_count}"
+        )
+
+    async def _read_new_rows(self, worksheet: AsyncWorksheet) -> bool:
+        if len(self._header) == 0:
+            return False
+        # 1行目はヘッダーなので最後に読み込んだ行は(読み込んだ行数 + 1)行目
+        last_row = self._row_count + 1
+        last_column = rowcol_to_a1(1, len(self._header))[:-1]
+        values = await worksheet.get_values(f"A{last_row}:{last_column}")
+        if len(values) == 0 or self._pad(values[0]) != self._last_values:
+            return False
+        self._append(values[1:])
+        logger.debug(f"read voice log, sheet={worksheet.title}, rows={len(values) - 1}")
+        return True
+
+    def _append(self, rows: List[List[str]]):
+        for row in rows:
+            row = self._pad(row)
+            # get_all_records()と同じ形式に変換する
+            record = dict(zip(self._header, numericise_all(row)))
+            try:
+                dt = back_from_modified_datetime(record["date"], record["time"])
+            except Exception as e:
+                logger.error(e)
+                # 途中までしか読み込めていないので次回は全体を読み込み直す
+                self._loaded_at = None
+                raise _InvalidRecordError(record)
+            # ログは日本時間で記録している
+            timestamp = dt.replace(tzinfo=Constant.JST).timestamp()
+            # 基本的には末尾に追加されるが、前後していても日時順を保つ
+            index = bisect.bisect_right(self._timestamps, timestamp)
+            self._timestamps.insert(index, timestamp)
+            self._records.insert(index, record)
+            self._row_count += 1
+            self._last_values = row
+
+    def _pad(self, row: List[str]) -> List[str]:
+        return row + [""] * (len(self._header) - len(row))
+
 
 class LoggingVoiceStates(Cog, CogHelper):
     def __init__(self, bot: Bot):
         CogHelper.__init__(self, bot)
         self._gspread_client = GSpreadClient()
         self._count: Optional[str] = None
+        self._duration = False
         self._user_ids: List[int]
         self._channel_ids: List[int]
         self._before: Optional[datetime.datetime] = None
         self._after: Optional[datetime.datetime] = None
         self._minimum = True
+        self._format = ExportFormat.JSON
+        self._compression: Optional[str] = None
+        self._log_caches: Dict[int, _VoiceLogCache] = {}
+        self._log_cache_ttl = float(
+            os.environ.get("LOGGING_VOICE_STATES_CACHE_TTL", "3600")
+        )
+        # 集計期間の開始時点で続いている区間を組み立てるために遡って読む時間
+        self._session_lookback = datetime.timedelta(
+            hours=float(os.environ.get("LOGGING_VOICE_STATES_SESSION_LOOKBACK", "24"))
+        )
+        # ボイスチャットのログは受け取った時点でローカルに記録し、サーバー毎にまとめてシートに書き込む
+        self._journal = Journal(
+            os.environ.get(
+                "LOGGING_VOICE_STATES_JOURNAL_FILE", "logging_voice_states.sqlite3"
+            )
+        )
+        self._replicator = JournalReplicator(
+            bot.loop,
+            self._journal,
+            self._append_records,
+            float(os.environ.get("LOGGING_VOICE_STATES_FLUSH_INTERVAL", "10")),
+            int(os.environ.get("LOGGING_VOICE_STATES_FLUSH_SIZE", "100")),
+        )
+
+    def cog_unload(self):
+        self._replicator.close()
 
     @command()
     async def logging_voice_states(self, ctx, *args):
         await self.execute(ctx, args)
 
     def _parse_args(self, ctx: Context, args: Dict[str, str]):
-        if "count" not in args:
-            raise ArgumentError(ctx, count="対象のステートを必ず指定してください")
+        if "count" not in args and "duration" not in args:
+            raise ArgumentError(ctx, count="対象のステートかdurationを必ず指定してください")
 
         self._count = args.get("count", None)
+        self._duration = get_bool(args, "duration", False)
         self._user_ids = get_list(args, "user", ",", lambda value: int(value), [])
         self._channel_ids = get_list(args, "channel", ",", lambda value: int(value), [])
         self._before, self._after = get_before_after_fmts(
             ctx, args, *Constant.DATE_FORMATS, tz=Constant.JST
         )
         self._minimum = get_bool(args, "minimum", True)
+        self._format, self._compression = get_export_options(ctx, args)
 
     async def _execute(self, ctx: Context):
         if self._count is not None:
             await self._execute_count(ctx)
+        if self._duration:
+            await self._execute_duration(ctx)
 
-    async def _execute_count(self, ctx: Context):
+    async def _get_log_cache(
+        self, guild: discord.Guild
+    ) -> Tuple[AsyncWorksheet, _VoiceLogCache]:
         sheet_id = os.environ["LOGGING_VOICE_STATES_SHEET_ID"]
-        workbook = self._gspread_client.open_by_key(sheet_id)
-        sheet_name = str(ctx.guild.id)
-        worksheet = get_or_add_worksheet(workbook, sheet_name, duplicate_template_sheet)
+        sheet_name = str(guild.id)
+        worksheet = await self._gspread_client.get_or_add_worksheet(
+            sheet_id, sheet_name, template=TEMPLATE_SHEET
+        )
 
-        records = []
-        for record in worksheet.get_all_records():
-            try:
-                dt = back_from_modified_datetime(record["date"], record["time"])
-            except Exception as e:
-                logger.error(e)
-                raise ExecutionError(
-                    ctx,
-                    title="既存レコードの日時のパースに失敗しました。",
-                    date=record["date"],
-                    time=record["time"],
-                )
-            if self._after is not None and self._before is not None:
-                if self._after < dt < self._before:
-                    records.append(record)
-            elif self._after is None and self._before is not None:
-                if dt < self._before:
-                    records.append(record)
-            elif self._after is not None and self._before is None:
-                if self._after < dt:
-                    records.append(record)
-            else:
-                records.append(record)
+        if guild.id not in self._log_caches:
+            self._log_caches[guild.id] = _VoiceLogCache(self._log_cache_ttl)
+        return worksheet, self._log_caches[guild.id]
 
+    def _get_users(self, guild: discord.Guild) -> List[Tuple[int, str]]:
+        members = MemberDirectory().get(guild)
         if len(self._user_ids) > 0:
             # ユーザーIDの指定がある→指定のユーザーだけ
-            users = [m for m in ctx.guild.members if m.id in self._user_ids]
+            user_ids = [i for i in self._user_ids if i in members.names]
         else:
             # ユーザーIDの指定がない→BOT以外のサーバー参加ユーザー
-            users = [m for m in ctx.guild.members if not m.bot]
+            user_ids = members.ids
+        return [(user_id, members.names[user_id]) for user_id in user_ids]
 
+    def _get_channels(self, guild: discord.Guild) -> List[discord.abc.GuildChannel]:
         if len(self._channel_ids) > 0:
             # チャンネルIDの指定がある→指定のチャンネルだけ
-            channels = [c for c in ctx.guild.channels if c.id in self._channel_ids]
+            return [c for c in guild.channels if c.id in self._channel_ids]
         else:
             # チャンネルIDの指定がない→サーバーのボイスチャンネル
-            channels = [
-                c for c in ctx.guild.channels if isinstance(c, discord.VoiceChannel)
-            ]
+            return [c for c in guild.channels if isinstance(c, discord.VoiceChannel)]
+
+    async def _execute_count(self, ctx: Context):
+        worksheet, cache = await self._get_log_cache(ctx.guild)
+        try:
+            records = await cache.get_records(worksheet, self._before, self._after)
+        except _InvalidRecordError as e:
+            raise ExecutionError(
+                ctx,
+                title="既存レコードの日時のパースに失敗しました。",
+                date=e.record["date"],
+                time=e.record["time"],
+            )
+
+        users = self._get_users(ctx.guild)
+        channels = self._get_channels(ctx.guild)
 
-        results = []
-        for user in users:
+        counts = _count_by_user_channel(records, self._count)
+
+        writer = RecordWriter(
+            self._format, ctx.guild.filesize_limit, self._compression, _COUNT_FIELDNAMES
+        )
+        for user_id, user_name in users:
+            user_counts = counts.get(user_id, {})
+            # 0回は省略
+            if self._minimum and len(user_counts) == 0:
+                continue
             for channel in channels:
-                matched = [
-                    record
-                    for record in records
-                    if record["user_id"] == user.id
-                    and record["channel_id"] == channel.id
-                    and self._count in record["state"]
-                ]
-                count = len(matched)
+                count = user_counts.get(channel.id, 0)
                 # 0回は省略
                 if self._minimum and count == 0:
                     continue
-                results.append(
+                writer.write(
                     {
-                        "user": {"id": user.id, "name": user.display_name},
+                        "user": {"id": user_id, "name": user_name},
                         "channel": {"id": channel.id, "name": channel.name},
                         "state": self._count,
                         "count": count,
                     }
                 )
+        parts = writer.close()
 
         before_str, after_str = get_corrected_before_after_str(
             self._before, self._after, ctx.guild, Constant.JST, *Constant.DATE_FORMATS
         )
 
-        filename = f"logging_voice_states_count_{self._count}_{after_str}_{before_str}.json".replace(
+        stem = f"logging_voice_states_count_{self._count}_{after_str}_{before_str}"
+        stem = stem.replace("/", "")
+        await send_parts(ctx, parts, stem, writer.extension)
+
+    async def _execute_duration(self, ctx: Context):
+        worksheet, cache = await self._get_log_cache(ctx.guild)
+        # 期間の開始時点で続いている区間も集計できるように少し遡って読み込む
+        after = (
+            self._after - self._session_lookback if self._after is not None else None
+        )
+        try:
+            # 期間の終わりの時点で続いている区間を閉じられるように、期間より後も読み込む
+            timed_records = await cache.get_timed_records(worksheet, None, after)
+        except _InvalidRecordError as e:
+            raise ExecutionError(
+                ctx,
+                title="既存レコードの日時のパースに失敗しました。",
+                date=e.record["date"],
+                time=e.record["time"],
+            )
+
+        end = self._before.timestamp() if self._before is not None else None
+        aggregator = _SessionAggregator(
+            self._after.timestamp() if self._after is not None else None, end
+        )
+        for timestamp, record in timed_records:
+            # 期間より後の記録は、続いている区間が全て閉じたらそれ以上読まない
+            if end is not None and end <= timestamp and not aggregator.has_open_spans:
+                break
+            aggregator.feed(timestamp, record)
+        aggregator.finish(
+            time.time(),
+            lambda user_id, kind, channel_id: _is_active(
+                ctx.guild, user_id, kind, channel_id
+            ),
+        )
+
+        users = self._get_users(ctx.guild)
+        channels = self._get_channels(ctx.guild)
+
+        writer = RecordWriter(
+            self._format,
+            ctx.guild.filesize_limit,
+            self._compression,
+            _DURATION_FIELDNAMES,
+        )
+        for user_id, user_name in users:
+            user_totals = aggregator.totals.get(user_id, {})
+            # 0秒は省略
+            if self._minimum and len(user_totals) == 0:
+                continue
+            for channel in channels:
+                total = user_totals.get(channel.id)
+                if total is None:
+                    # 0秒は省略
+                    if self._minimum:
+                        continue
+                    total = {"sessions": 0, "voice": 0.0, "stream": 0.0, "video": 0.0}
+                writer.write(
+                    {
+                        "user": {"id": user_id, "name": user_name},
+                        "channel": {"id": channel.id, "name": channel.name},
+                        "sessions": total["sessions"],
+                        # 秒単位
+                        "voice": round(total["voice"]),
+                        "stream": round(total["stream"]),
+                        "video": round(total["video"]),
+                    }
+                )
+        parts = writer.close()
+
+        before_str, after_str = get_corrected_before_after_str(
+            self._before, self._after, ctx.guild, Constant.JST, *Constant.DATE_FORMATS
+        )
+
+        stem = f"logging_voice_states_duration_{after_str}_{before_str}".replace(
             "/", ""
         )
-        with contextlib.closing(io.StringIO()) as buffer:
-            json.dump(results, buffer, default=parse_json, indent=2, ensure_ascii=False)
-            buffer.seek(0)
-            await ctx.send(file=discord.File(buffer, filename))
+        await send_parts(ctx, parts, stem, writer.extension)
 
     @Cog.listener()
     async def on_voice_state_update(
@@ -150,11 +566,6 @@ class LoggingVoiceStates(Cog, CogHelper):
         before: discord.VoiceState,
         after: discord.VoiceState,
     ):
-        sheet_id = os.environ["LOGGING_VOICE_STATES_SHEET_ID"]
-        workbook = self._gspread_client.open_by_key(sheet_id)
-        sheet_name = str(member.guild.id)
-        worksheet = get_or_add_worksheet(workbook, sheet_name, duplicate_template_sheet)
-
         when_date_changed_str = os.environ.get(
             "LOGGING_VOICE_STATES_WHEN_DATE_CHANGED", "00:00:00"
         )
@@ -224,8 +635,19 @@ class LoggingVoiceStates(Cog, CogHelper):
             state.append("afk_out")
 
         record["state"] = ",".join(sorted(set(state), key=state.index))
-        worksheet.append_row(list(record.values()), value_input_option="USER_ENTERED")
-        logger.debug(f"append record: {record}")
+        key = str(member.guild.id)
+        self._journal.append(key, list(record.values()))
+        self._replicator.notify(key)
+        logger.debug(f"journal record: {record}")
+
+    async def _append_records(self, sheet_name: str, rows: List[List[str]]):
+        sheet_id = os.environ["LOGGING_VOICE_STATES_SHEET_ID"]
+        # ログの書き込みはコマンドの応答よりも後回しにする
+        with background_priority():
+            worksheet = await self._gspread_client.get_or_add_worksheet(
+                sheet_id, sheet_name, template=TEMPLATE_SHEET
+            )
+            await worksheet.append_rows(rows, value_input_option="USER_ENTERED")
 
 
 def setup(bot: Bot):
@@ -0,0 +1,52 @@
+import logging
+
+import discord
+from discord.ext.commands import Bot, Cog
+
+from utils.member_directory import MemberDirectory
+
+logger = logging.getLogger(__name__)
+
+
+class MemberDirectorySync(Cog):
+    """サーバーの参加メンバーの増減と表示名の変更を反映する"""
+
+    def __init__(self, bot: Bot):
+        self._bot = bot
+        self._member_directory = MemberDirectory()
+
+    @Cog.listener()
+    async def on_ready(self):
+        # 切断している間のイベントは届かないので作り直す
+        self._member_directory.clear()
+
+    @Cog.listener()
+    async def on_guild_available(self, guild: discord.Guild):
+        # 一時的に利用できなかったサーバーはメンバーが変わっている可能性があるので作り直す
+        self._member_directory.forget(guild.id)
+
+    @Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self._member_directory.add(member)
+
+    @Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self._member_directory.remove(member)
+
+    @Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.display_name != after.display_name:
+            self._member_directory.add(after)
+
+    @Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User):
+        if before.name != after.name:
+            self._member_directory.rename(after.id, self._bot.guilds)
+
+    @Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        self._member_directory.forget(guild.id)
+
+
+def setup(bot: Bot):
+    return bot.add_cog(MemberDirectorySync(bot))
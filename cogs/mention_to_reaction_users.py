@@ -1,10 +1,11 @@
+import asyncio
 import contextlib
-import copy
+import heapq
 import io
 import json
 import logging
 import os
-from typing import Optional, Dict, List, Union
+from typing import Collection, Optional, Dict, List, Set, Union
 
 import discord.ext.commands
 import dispander.module
@@ -16,30 +17,75 @@ from discord_ext_commands_coghelper import (
     ChannelNotFoundError,
     UserNotFoundError,
 )
-from discord_ext_commands_coghelper.utils import get_bool, find_text_channel
-
-from gspread import Worksheet
-
-from utils.gspread_client import GSpreadClient, get_or_add_worksheet
+from discord_ext_commands_coghelper.utils import get_bool
+
+from cogs.constant import Constant
+from utils.gspread_client import (
+    AsyncWorksheet,
+    GSpreadClient,
+    appended_row,
+    background_priority,
+)
+from utils.member_directory import MemberDirectory
+from utils.message_locator import MessageLocator, parse_message_link
+from utils.reaction_index import EmojiKey, ReactionIndex, emoji_key
 from utils.misc import parse_json
 
 logger = logging.getLogger(__name__)
 
 
-async def _find_no_reaction_users(
-    message: discord.Message, candidates: List[Union[discord.Member, discord.User]]
-) -> List[Union[discord.Member, discord.User]]:
-    result = copy.copy(candidates)
-    for reaction in message.reactions:
-        users = [user async for user in reaction.users()]
-        for candidate in candidates:
-            if candidate not in result:
-                continue
-            for user in users:
-                if candidate.id == user.id:
-                    result.remove(candidate)
+class _Constant(Constant):
+    SHEET_ID = os.environ["IGNORE_LIST_SHEET_ID"]
+    # リアクションしたユーザーを同時に取得するリアクションの数
+    REACTION_CONCURRENCY = 4
+    # メッセージのチャンネルを覚えておく数
+    MESSAGE_CACHE_SIZE = 10000
+    # 最近発言のあったチャンネルを覚えておく数
+    ACTIVE_CHANNEL_SIZE = 1000
+    # メッセージを同時に探すチャンネルの数
+    LOCATE_CONCURRENCY = 8
+    # リアクションを監視するメッセージの数
+    WATCH_SIZE = 100
+
+
+async def _gather_reaction_users(
+    reactions: List[discord.Reaction],
+) -> List[List[Union[discord.Member, discord.User]]]:
+    # リアクション毎のユーザーの取得はページングされるので、リアクション同士は並行して取得する
+    semaphore = asyncio.Semaphore(_Constant.REACTION_CONCURRENCY)
+
+    async def fetch(reaction: discord.Reaction):
+        async with semaphore:
+            return [user async for user in reaction.users()]
+
+    return await asyncio.gather(*[fetch(r) for r in reactions])
 
-    return result
+
+async def _fetch_reaction_users(
+    reactions: List[discord.Reaction],
+) -> Dict[int, Union[discord.Member, discord.User]]:
+    users = {}
+    for reaction_users in await _gather_reaction_users(reactions):
+        for user in reaction_users:
+            users[user.id] = user
+    return users
+
+
+async def _snapshot_reactions(message: discord.Message) -> Dict[EmojiKey, Set[int]]:
+    reactions = message.reactions
+    return {
+        emoji_key(reaction.emoji): {user.id for user in users}
+        for reaction, users in zip(reactions, await _gather_reaction_users(reactions))
+    }
+
+
+def _match_emoji(key: EmojiKey, emoji: str) -> bool:
+    emoji_id, name = key
+    if emoji_id is not None:
+        # カスタム絵文字は名前が含まれているか見る ※:{name}:の形式なはずなので
+        return name in emoji
+    # Unicode絵文字は完全一致でOK
+    return name == emoji
 
 
 async def _find_reaction_users(
@@ -47,34 +93,23 @@ async def _find_reaction_users(
 ) -> List[Union[discord.Member, discord.User]]:
     target = None
     for reaction in message.reactions:
-        if isinstance(reaction.emoji, discord.Emoji):
-            # カスタム絵文字は名前が含まれているか見る ※:{name}:の形式なはずなので
-            if reaction.emoji.name not in emoji:
-                continue
-        if isinstance(reaction.emoji, discord.PartialEmoji):
-            # Partial絵文字も名前が含まれているか見る
-            if reaction.emoji.id is None:
-                continue
-            if reaction.emoji.name not in emoji:
-                continue
-        if isinstance(reaction.emoji, str):
-            # Unicode絵文字は完全一致でOK
-            if reaction.emoji != emoji:
-                continue
-        target = reaction
-        break
+        if _match_emoji(emoji_key(reaction.emoji), emoji):
+            target = reaction
+            break
 
     if target is None:
         return []
-    return [user async for user in target.users()]
+    return list((await _fetch_reaction_users([target])).values())
 
 
 class _NormalCommand:
     def __init__(self):
         self._message_id: Optional[int] = None
+        self._channel_id: Optional[int] = None
         self._reaction_emoji: Optional[str] = None
         self._use_ignore_list = True
         self._expand_message = False
+        self._watch: Optional[bool] = None
 
     def parse_args(self, ctx: Context, args: Dict[str, str]):
         if "message" not in args:
@@ -82,74 +117,148 @@ class _NormalCommand:
         if "reaction" not in args:
             raise ArgumentError(ctx, reaction="対象のリアクションを必ず指定してください")
 
-        try:
-            self._message_id = int(args["message"])
-        except ValueError:
-            raise ArgumentError(ctx, message="メッセージIDの指定が正しくありません")
+        link = parse_message_link(args["message"])
+        if link is not None:
+            # メッセージリンクであればチャンネルも分かる
+            guild_id, self._channel_id, self._message_id = link
+            # 他のサーバーのメッセージはこのサーバーのチャンネルを探しても見つからない
+            if guild_id != ctx.guild.id:
+                raise ArgumentError(ctx, message="このサーバー内のメッセージのリンクを指定してください")
+        else:
+            try:
+                self._message_id = int(args["message"])
+            except ValueError:
+                raise ArgumentError(ctx, message="メッセージIDかメッセージリンクの指定が正しくありません")
+        if "channel" in args:
+            try:
+                self._channel_id = int(args["channel"])
+            except ValueError:
+                raise ArgumentError(ctx, channel="チャンネルIDの指定が正しくありません")
 
         self._reaction_emoji = args["reaction"]
         # 通常モードではignore_listはデフォルトで利用する
         self._use_ignore_list = get_bool(args, "ignore_list", True)
         self._expand_message = get_bool(args, "expand_message", False)
-
-    async def execute(self, ctx: Context, ignore_ids: List[int]):
-        # 無視リストを使わない
-        if not self._use_ignore_list:
-            ignore_ids.clear()
-
-        channel, message = await find_text_channel(ctx.guild, self._message_id)
+        if "watch" in args:
+            self._watch = get_bool(args, "watch")
+
+    async def execute(
+        self,
+        ctx: Context,
+        ignore_ids: Collection[int],
+        message_locator: MessageLocator,
+        reaction_index: ReactionIndex,
+    ):
+        # 無視リストを使わない場合は空にする
+        ignore_ids = set(ignore_ids) if self._use_ignore_list else set()
+        member_ids = MemberDirectory().get(ctx.guild).ids
+
+        if self._watch is False:
+            reaction_index.unwatch(self._message_id)
+
+        # 監視中のメッセージは手元の状態だけで答える
+        entry = reaction_index.get(self._message_id)
+        if entry is not None:
+            message = entry.message
+            channel = ctx.guild.get_channel(message.channel.id)
+            reactions = entry.reactions
+        else:
+            channel, message = await message_locator.locate(
+                ctx.guild, self._message_id, self._channel_id
+            )
+            reactions = None
 
         if channel is None:
             raise ChannelNotFoundError(
-                ctx, channel_id="None", message_id=self._message_id
+                ctx, channel_id=str(self._channel_id), message_id=self._message_id
             )
 
         logger.debug(
             f"fetch message: channel={channel.name}, message={message.content}"
         )
 
+        if reactions is None and self._watch:
+            reactions = await reaction_index.watch(
+                message, lambda: _snapshot_reactions(message)
+            )
+
         if self._reaction_emoji.lower() == "none":
             # リアクションをしていないユーザーを探す
             logger.debug("find no reaction users")
             title = "リアクションしていない"
-            targets = self._filter_users(channel.members, message, ignore_ids)
-            result = await _find_no_reaction_users(message, targets)
+            if reactions is not None:
+                reaction_user_ids = set().union(*reactions.values())
+            else:
+                reaction_user_ids = (
+                    await _fetch_reaction_users(message.reactions)
+                ).keys()
+            # 除外するユーザーで候補を絞ってから、チャンネルを見られるかどうかを確認する
+            # ※候補はサーバーのメンバーの順番のまま
+            excluded_ids = {message.author.id}.union(reaction_user_ids, ignore_ids)
+            candidate_ids = [i for i in member_ids if i not in excluded_ids]
+            result = [
+                member
+                for member in self._get_users(ctx, candidate_ids)
+                if isinstance(member, discord.Member)
+                and channel.permissions_for(member).read_messages
+            ]
         elif self._reaction_emoji.lower() == "all":
             # リアクションしている全てのユーザーを探す
             logger.debug("find all reaction users")
             title = "リアクションしている"
-            result = []
-            for reaction in message.reactions:
-                users = [user async for user in reaction.users()]
-                result.extend(self._filter_users(users, message, ignore_ids))
+            if reactions is not None:
+                users = self._get_users(ctx, set().union(*reactions.values()))
+            else:
+                users = (await _fetch_reaction_users(message.reactions)).values()
+            result = self._filter_users(users, message, ignore_ids)
         else:
             # 指定の絵文字でリアクションしているユーザーを探す
             logger.debug(f"find reaction users: emoji={self._reaction_emoji}")
             title = f"{self._reaction_emoji} をリアクションしている"
-            targets = await _find_reaction_users(message, self._reaction_emoji)
+            if reactions is not None:
+                key = next(
+                    (k for k in reactions if _match_emoji(k, self._reaction_emoji)),
+                    None,
+                )
+                targets = self._get_users(ctx, reactions.get(key, set()))
+            else:
+                targets = await _find_reaction_users(message, self._reaction_emoji)
             result = self._filter_users(targets, message, ignore_ids)
 
         logger.debug("send result")
         if len(result) > 0:
             title = f"{title}ユーザーは以下の通りです"
             # 重複は除く
-            description = ", ".join([user.mention for user in list(set(result))])
+            description = ", ".join({user.id: user.mention for user in result}.values())
         else:
             title = f"{title}ユーザーは居ませんでした"
             description = ""
         embed = discord.Embed(title=title, description=description)
         embed.add_field(name="対象のメッセージ", value=message.jump_url, inline=False)
+        if reactions is not None:
+            embed.set_footer(text="リアクションを監視中のメッセージです")
 
         await ctx.send(embed=embed)
 
         if self._expand_message:
             await self._send_expand_message(ctx, message)
 
+    @staticmethod
+    def _get_users(
+        ctx: Context, user_ids: Collection[int]
+    ) -> List[Union[discord.Member, discord.User]]:
+        # サーバーから抜けたユーザーはキャッシュにあれば対象にする ※通信はしない
+        users = [
+            ctx.guild.get_member(user_id) or ctx.bot.get_user(user_id)
+            for user_id in user_ids
+        ]
+        return [user for user in users if user is not None]
+
     @staticmethod
     def _filter_users(
-        users: List[Union[discord.Member, discord.User]],
+        users: Collection[Union[discord.Member, discord.User]],
         m: discord.Message,
-        ignore_ids: List[int],
+        ignore_ids: Collection[int],
     ) -> List[Union[discord.Member, discord.User]]:
         # BOTではない かつ メッセージの投稿者ではない かつ 無視リストに含まれていない
         return [
@@ -172,6 +281,53 @@ class _NormalCommand:
             await ctx.send(embed=embed)
 
 
+class _IgnoreList:
+    """サーバー毎の無視リスト
+
+    シートのA列に1セル1ユーザーで保存し、メモリ上の内容を正として変更のあったセルだけを書き込む
+    除去したセルは空にして次の追加で再利用する
+    """
+
+    def __init__(self, values: List[str]):
+        # {user_id: 行番号}
+        self._rows: Dict[int, int] = {}
+        self._free_rows: List[int] = []
+        for row, value in enumerate(values, 1):
+            if str(value).strip() == "":
+                self._free_rows.append(row)
+            else:
+                self._rows[int(value)] = row
+        heapq.heapify(self._free_rows)
+
+    @property
+    def ids(self) -> Collection[int]:
+        return self._rows.keys()
+
+    def sorted_ids(self) -> List[int]:
+        # シートの並び順
+        return sorted(self._rows.keys(), key=self._rows.get)
+
+    async def add(self, worksheet: AsyncWorksheet, user_id: int):
+        if len(self._free_rows) > 0:
+            row = heapq.heappop(self._free_rows)
+            await worksheet.update(f"A{row}", [[str(user_id)]])
+        else:
+            # 空いているセルが無ければ末尾に追加し、追加された行番号を覚えておく
+            response = await worksheet.append_rows([[str(user_id)]], table_range="A1")
+            row = appended_row(response)
+        self._rows[user_id] = row
+
+    async def remove(self, worksheet: AsyncWorksheet, user_id: int):
+        row = self._rows.pop(user_id)
+        await worksheet.update(f"A{row}", [[""]])
+        heapq.heappush(self._free_rows, row)
+
+    async def clear(self, worksheet: AsyncWorksheet):
+        await worksheet.batch_clear(["A:A"])
+        self._rows.clear()
+        self._free_rows = []
+
+
 class _ManageCommand:
     def __init__(self):
         self._use_ignore_list = False
@@ -191,30 +347,32 @@ class _ManageCommand:
         self._remove = args.get("remove", None)
         self._show = get_bool(args, "show")
 
-    async def execute(self, ctx: Context, worksheet: Worksheet, ignore_ids: List[int]):
+    async def execute(
+        self, ctx: Context, worksheet: AsyncWorksheet, ignore_list: _IgnoreList
+    ):
         if self._use_ignore_list:
-            await self._manage_ignore_list(ctx, worksheet, ignore_ids)
+            await self._manage_ignore_list(ctx, worksheet, ignore_list)
 
     async def _manage_ignore_list(
-        self, ctx: Context, worksheet: Worksheet, ignore_ids: List[int]
+        self, ctx: Context, worksheet: AsyncWorksheet, ignore_list: _IgnoreList
     ):
         if self._append != -1:
-            await self._append_ignore_list(ctx, worksheet, ignore_ids, self._append)
+            await self._append_ignore_list(ctx, worksheet, ignore_list, self._append)
         if self._remove is not None:
-            await self._remove_ignore_list(ctx, worksheet, ignore_ids, self._remove)
+            await self._remove_ignore_list(ctx, worksheet, ignore_list, self._remove)
         if self._download:
-            await self._download_ignore_list(ctx, worksheet, ignore_ids)
+            await self._download_ignore_list(ctx, worksheet, ignore_list)
         if self._show:
-            await self._show_ignore_list(ctx, worksheet, ignore_ids)
+            await self._show_ignore_list(ctx, worksheet, ignore_list)
 
     @classmethod
     async def _download_ignore_list(
-        cls, ctx: Context, worksheet: Worksheet, ignore_ids: List[int]
+        cls, ctx: Context, worksheet: AsyncWorksheet, ignore_list: _IgnoreList
     ):
         filename = f"ignore_list_{ctx.guild.id}.json"
         logger.debug(f"sheet={worksheet.id}, guild={ctx.guild.id}, json={filename}")
         ignore_dict = []
-        for user_id in ignore_ids:
+        for user_id in ignore_list.sorted_ids():
             user = ctx.guild.get_member(user_id)
             if user is None:
                 # 既にサーバーから抜けている場合も考慮する
@@ -234,30 +392,36 @@ class _ManageCommand:
 
     @classmethod
     async def _append_ignore_list(
-        cls, ctx: Context, worksheet: Worksheet, ignore_ids: List[int], append_id: int
+        cls,
+        ctx: Context,
+        worksheet: AsyncWorksheet,
+        ignore_list: _IgnoreList,
+        append_id: int,
     ):
         logger.debug(f"sheet={worksheet.id}, guild={ctx.guild.id}, user={append_id}")
         member = ctx.guild.get_member(append_id)
         if member is None:
             raise UserNotFoundError(ctx, append_id, guild_id=ctx.guild.id)
 
-        ignore_ids.append(append_id)
-        cls._update_cells(worksheet, [str(ignore_id) for ignore_id in ignore_ids])
+        if append_id in ignore_list.ids:
+            raise ExecutionError(ctx, title="️無視リストに既にユーザーが存在します", append=append_id)
+
+        await ignore_list.add(worksheet, append_id)
         await ctx.send(
             f"{member.display_name}[{append_id}] を {ctx.guild.name}[{ctx.guild.id}] の無視リストに追加しました。"
         )
 
     @classmethod
     async def _remove_ignore_list(
-        cls, ctx: Context, worksheet: Worksheet, ignore_ids: List[int], remove: str
+        cls,
+        ctx: Context,
+        worksheet: AsyncWorksheet,
+        ignore_list: _IgnoreList,
+        remove: str,
     ):
-        # intのリストに空の要素が追加できないのでstrにしている
-        ignore_list = [str(ignore_id) for ignore_id in ignore_ids]
-
         if remove.lower() == "all":
             logger.debug(f"sheet={worksheet.id}, guild={ctx.guild.id}, user=all")
-            # 要素数は変えずに空文字で埋めて全削除
-            ignore_list = ["" for _ in ignore_list]
+            await ignore_list.clear(worksheet)
             output_text = f"{ctx.guild.name}[{ctx.guild.id}] の無視リストから全てのユーザーを除去しました。"
         else:
             try:
@@ -268,29 +432,26 @@ class _ManageCommand:
             logger.debug(
                 f"sheet={worksheet.id}, guild={ctx.guild.id}, user={remove_id}"
             )
-            if remove_id not in ignore_ids:
+            if remove_id not in ignore_list.ids:
                 raise ExecutionError(ctx, title="️無視リストにユーザーが存在しません", remove=remove_id)
 
-            # 要素数は変えずに空文字で埋めて削除
-            ignore_list.remove(str(remove_id))
-            ignore_list.append("")
+            await ignore_list.remove(worksheet, remove_id)
             output_text = f"{ctx.guild.name}[{ctx.guild.id}] の無視リストから user_id={remove_id} を除去しました。"
 
-        cls._update_cells(worksheet, ignore_list)
         await ctx.send(output_text)
 
     @classmethod
     async def _show_ignore_list(
-        cls, ctx: Context, worksheet: Worksheet, ignore_ids: List[int]
+        cls, ctx: Context, worksheet: AsyncWorksheet, ignore_list: _IgnoreList
     ):
         logger.debug(f"sheet={worksheet.id}, guild={ctx.guild.id}")
         embed = discord.Embed(
             title="/mention_to_reaction_users 無視リスト",
             description=f"サーバー: {ctx.guild.name}[{ctx.guild.id}]",
         )
-        if len(ignore_ids) == 0:
+        if len(ignore_list.ids) == 0:
             embed.add_field(name="なし", value="", inline=False)
-        for user_id in ignore_ids:
+        for user_id in ignore_list.sorted_ids():
             user = ctx.guild.get_member(user_id)
             if user is None:
                 embed.add_field(name="[Not Found]", value=f"{user_id}", inline=False)
@@ -300,13 +461,6 @@ class _ManageCommand:
                 )
         await ctx.send(embed=embed)
 
-    @staticmethod
-    def _update_cells(worksheet: Worksheet, values: List[str]):
-        cells = worksheet.range(f"A1:A{len(values)}")
-        for index, cell in enumerate(cells):
-            cell.value = values[index]
-        worksheet.update_cells(cells)
-
 
 class MentionToReactionUsers(Cog, CogHelper):
     def __init__(self, bot: Bot):
@@ -314,11 +468,68 @@ class MentionToReactionUsers(Cog, CogHelper):
         self._gspread_client = GSpreadClient()
         self._normal_command: Optional[_NormalCommand] = None
         self._manage_command: Optional[_ManageCommand] = None
+        self._message_locator = MessageLocator(
+            _Constant.MESSAGE_CACHE_SIZE,
+            _Constant.ACTIVE_CHANNEL_SIZE,
+            _Constant.LOCATE_CONCURRENCY,
+        )
+        self._ignore_lists: Dict[int, _IgnoreList] = {}
+        self._reaction_index = ReactionIndex(_Constant.WATCH_SIZE)
 
     @command()
     async def mention_to_reaction_users(self, ctx, *args):
         await self.execute(ctx, args)
 
+    @Cog.listener()
+    async def on_ready(self):
+        # 再接続でも呼ばれるので読み込み済みのサーバーは読み直さない
+        guild_ids = [g.id for g in self.bot.guilds if g.id not in self._ignore_lists]
+        if len(guild_ids) == 0:
+            return
+        with background_priority():
+            # 全サーバーの無視リストをまとめて読み込む
+            values = await self._gspread_client.warm_up(
+                _Constant.SHEET_ID, [str(guild_id) for guild_id in guild_ids]
+            )
+        for guild_id in guild_ids:
+            # シートが無いサーバーはコマンドの実行時にシートを作ってから読み込む
+            if guild_id in self._ignore_lists or str(guild_id) not in values:
+                continue
+            column = [row[0] if len(row) > 0 else "" for row in values[str(guild_id)]]
+            self._ignore_lists[guild_id] = _IgnoreList(column)
+
+    @Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if not message.guild:
+            return
+        self._message_locator.remember(message)
+
+    @Cog.listener()
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        self._reaction_index.add(
+            payload.message_id, emoji_key(payload.emoji), payload.user_id
+        )
+
+    @Cog.listener()
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        self._reaction_index.remove(
+            payload.message_id, emoji_key(payload.emoji), payload.user_id
+        )
+
+    @Cog.listener()
+    async def on_raw_reaction_clear(self, payload: discord.RawReactionClearEvent):
+        self._reaction_index.clear(payload.message_id)
+
+    @Cog.listener()
+    async def on_raw_reaction_clear_emoji(
+        self, payload: discord.RawReactionClearEmojiEvent
+    ):
+        self._reaction_index.clear_emoji(payload.message_id, emoji_key(payload.emoji))
+
+    @Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self._reaction_index.unwatch(payload.message_id)
+
     def _parse_args(self, ctx: Context, args: Dict[str, str]):
         use_manage = get_bool(args, "manage")
         if use_manage:
@@ -329,26 +540,32 @@ class MentionToReactionUsers(Cog, CogHelper):
             self._normal_command.parse_args(ctx, args)
 
     async def _execute(self, ctx: Context):
-        # NOTE: シートの取得も1度だけでいいかもしれない
-        sheet_id = os.environ["IGNORE_LIST_SHEET_ID"]
-        workbook = self._gspread_client.open_by_key(sheet_id)
-        sheet_name = str(ctx.guild.id)
-        worksheet = get_or_add_worksheet(
-            workbook, sheet_name, lambda w, n: w.add_worksheet(n, rows=100, cols=1)
-        )
-        ignore_list = worksheet.col_values(1)
-        ignore_ids = [int(ignore_id) for ignore_id in ignore_list]
-        logger.debug(f"fetch ignore_ids: ignore_ids={ignore_ids}")
+        # 無視リストは読み込み済みであればシートを読み直さない
+        if ctx.guild.id not in self._ignore_lists:
+            worksheet = await self._get_worksheet(ctx.guild.id)
+            self._ignore_lists[ctx.guild.id] = _IgnoreList(
+                await worksheet.col_values(1)
+            )
+        ignore_list = self._ignore_lists[ctx.guild.id]
+        logger.debug(f"ignore_ids={list(ignore_list.ids)}")
 
         # Cog自体は使い回すのでCommandは毎回破棄する
         if self._manage_command is not None:
-            await self._manage_command.execute(ctx, worksheet, ignore_ids)
+            worksheet = await self._get_worksheet(ctx.guild.id)
+            await self._manage_command.execute(ctx, worksheet, ignore_list)
             self._manage_command = None
 
         if self._normal_command is not None:
-            await self._normal_command.execute(ctx, ignore_ids)
+            await self._normal_command.execute(
+                ctx, ignore_list.ids, self._message_locator, self._reaction_index
+            )
             self._normal_command = None
 
+    async def _get_worksheet(self, guild_id: int) -> AsyncWorksheet:
+        return await self._gspread_client.get_or_add_worksheet(
+            _Constant.SHEET_ID, str(guild_id), cols=1
+        )
+
 
 def setup(bot: Bot):
     return bot.add_cog(MentionToReactionUsers(bot))
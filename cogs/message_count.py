@@ -1,3 +1,4 @@
+import asyncio
 import contextlib
 import csv
 import datetime
@@ -22,29 +23,31 @@ from discord_ext_commands_coghelper.utils import (
 )
 
 from cogs.constant import Constant
+from utils.member_directory import MemberDirectory
+from utils.message_store import MessageStore
 
 logger = logging.getLogger(__name__)
 
 
+class _Constant(Constant):
+    # 同時に履歴を取得するチャンネル数のデフォルト値
+    DEFAULT_CONCURRENCY = 4
+
+
 class _MessageCounter:
-    def __init__(self, user: discord.User, channel: discord.abc.GuildChannel):
-        self.user = user
+    def __init__(self, user_id: int, user_name: str, channel: discord.abc.GuildChannel):
+        self.user_id = user_id
+        self.user_name = user_name
         self.channel = channel
         self.count = 0
 
     def __str__(self):
-        return f"user=[{self.user}], channel=[{self.channel}], count={self.count}"
-
-    def try_increment(self, user: discord.User):
-        if self.user.id != user.id:
-            return False
-        self.count += 1
-        return True
+        return f"user=[{self.user_name}], channel=[{self.channel}], count={self.count}"
 
 
 class _MessageCountResult:
-    def __init__(self, user: discord.User):
-        self.user = user
+    def __init__(self, user_name: str):
+        self.user_name = user_name
         self.result_map = {}
 
     def __str__(self):
@@ -54,7 +57,7 @@ class _MessageCountResult:
         self.result_map[channel] = count
 
     def to_dict(self):
-        output = {"user": self.user.display_name}
+        output = {"user": self.user_name}
         for channel, count in self.result_map.items():
             output[channel.name] = count
         return output
@@ -63,9 +66,12 @@ class _MessageCountResult:
 class MessageCount(Cog, CogHelper):
     def __init__(self, bot: Bot):
         CogHelper.__init__(self, bot)
+        self._message_store = MessageStore()
         self._channel_ids: List[int]
         self._before: Optional[datetime.datetime] = None
         self._after: Optional[datetime.datetime] = None
+        self._concurrency = _Constant.DEFAULT_CONCURRENCY
+        self._slices = 1
 
     @command()
     async def message_count(self, ctx, *args):
@@ -79,6 +85,22 @@ class MessageCount(Cog, CogHelper):
         self._before, self._after = get_before_after_fmts(
             ctx, args, *Constant.DATE_FORMATS, tz=Constant.JST
         )
+        try:
+            self._concurrency = int(
+                args.get("concurrency", _Constant.DEFAULT_CONCURRENCY)
+            )
+        except ValueError:
+            raise ArgumentError(ctx, concurrency="同時取得数の指定が正しくありません")
+        if self._concurrency < 1:
+            raise ArgumentError(ctx, concurrency="同時取得数は1以上を指定してください")
+        try:
+            self._slices = int(args.get("slice", 1))
+        except ValueError:
+            raise ArgumentError(ctx, slice="分割数の指定が正しくありません")
+        if not 1 <= self._slices <= Constant.MAX_HISTORY_SLICES:
+            raise ArgumentError(
+                ctx, slice=f"分割数は1~{Constant.MAX_HISTORY_SLICES}の範囲で指定してください"
+            )
 
     async def _execute(self, ctx: Context):
         before = to_utc_naive(self._before)
@@ -87,21 +109,36 @@ class MessageCount(Cog, CogHelper):
             self._before, self._after, ctx.guild, Constant.JST, *Constant.DATE_FORMATS
         )
 
-        result_map = {}
+        channels = []
         for channel_id in self._channel_ids:
             channel = ctx.guild.get_channel(channel_id)
             if channel is None:
                 raise ChannelNotFoundError(ctx, channel_id)
             if not isinstance(channel, discord.TextChannel):
                 raise ChannelTypeError(ctx, channel, discord.ChannelType.text)
-
-            logger.debug(
-                f"{channel} count from history, after={after_str} before={before_str}"
-            )
-            message_counters = await self._count_messages(
-                ctx.guild, channel, before, after
-            )
-            result_map[channel] = message_counters
+            channels.append(channel)
+
+        semaphore = asyncio.Semaphore(self._concurrency)
+
+        async def count(target: discord.TextChannel):
+            async with semaphore:
+                logger.debug(
+                    f"{target} count from history, "
+                    f"after={after_str} before={before_str}"
+                )
+                return target, await self._count_messages(
+                    ctx.guild, target, before, after, self._slices
+                )
+
+        # 複数チャンネルの履歴を並行して取得し、取得が終わったものから結果に加える
+        counted = {}
+        for future in asyncio.as_completed([count(channel) for channel in channels]):
+            channel, message_counters = await future
+            logger.debug(f"{channel} counted")
+            counted[channel] = message_counters
+
+        # 列の並びは指定されたチャンネルの順番に揃える
+        result_map = {channel: counted[channel] for channel in channels}
 
         results = self._convert_to_message_count_result(result_map)
 
@@ -111,7 +148,8 @@ class MessageCount(Cog, CogHelper):
             fieldnames = ["user"]
             fieldnames.extend([key.name for key in result_map.keys()])
 
-            writer = csv.DictWriter(buffer, fieldnames)
+            # 他のチャンネルにしか発言していないユーザーの列は0で埋める
+            writer = csv.DictWriter(buffer, fieldnames, restval=0)
             writer.writeheader()
 
             for user_id, result in results.items():
@@ -127,24 +165,35 @@ class MessageCount(Cog, CogHelper):
                 embed.add_field(name=f"#{channel.name}", value=channel.id)
             await ctx.send(embed=embed, file=discord.File(buffer, filename))
 
-    @staticmethod
     async def _count_messages(
+        self,
         guild: discord.Guild,
         channel: discord.TextChannel,
         before: datetime.datetime,
         after: datetime.datetime,
-    ):
-        message_counters = [
-            _MessageCounter(member, channel)
-            for member in guild.members
-            if not member.bot
-        ]
-
-        async for message in channel.history(limit=None, before=before, after=after):
-            for counter in message_counters:
-                counter.try_increment(message.author)
-
-        return message_counters
+        slices: int = 1,
+    ) -> List[_MessageCounter]:
+        # 発言の無いメンバーも0件として出力するため先にBOT以外のメンバー分を用意しておく
+        members = MemberDirectory().get(guild)
+        message_counters: Dict[int, _MessageCounter] = {
+            user_id: _MessageCounter(user_id, members.names[user_id], channel)
+            for user_id in members.ids
+        }
+
+        await self._message_store.sync(channel, before, after, slices)
+        for author_id, display_name, bot, count in self._message_store.count_by_author(
+            channel.id, before, after
+        ):
+            counter = message_counters.get(author_id)
+            if counter is None:
+                # 既にサーバーから抜けているユーザーも集計する ※BOTとWebhookは除く
+                if bot:
+                    continue
+                counter = _MessageCounter(author_id, display_name, channel)
+                message_counters[author_id] = counter
+            counter.count = count
+
+        return list(message_counters.values())
 
     @staticmethod
     def _convert_to_message_count_result(
@@ -153,9 +202,9 @@ class MessageCount(Cog, CogHelper):
         results = {}
         for channel, message_counters in counter_map.items():
             for counter in message_counters:
-                if counter.user.id not in results:
-                    results[counter.user.id] = _MessageCountResult(counter.user)
-                results[counter.user.id].add(channel, counter.count)
+                if counter.user_id not in results:
+                    results[counter.user_id] = _MessageCountResult(counter.user_name)
+                results[counter.user_id].add(channel, counter.count)
 
         return results
 
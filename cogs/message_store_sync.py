@@ -0,0 +1,41 @@
+import logging
+
+import discord
+from discord.ext.commands import Bot, Cog
+from discord.utils import parse_time
+
+from utils.message_store import MessageStore
+
+logger = logging.getLogger(__name__)
+
+
+class MessageStoreSync(Cog):
+    """保存済みのメッセージに編集と削除を反映する"""
+
+    def __init__(self, bot: Bot):
+        self._bot = bot
+        self._message_store = MessageStore()
+
+    @Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # 埋め込みの展開などでも呼ばれるので本文が含まれている場合だけ反映する
+        if "content" not in payload.data:
+            return
+        edited_at = parse_time(payload.data.get("edited_timestamp"))
+        self._message_store.update_content(
+            payload.message_id, payload.data["content"], edited_at
+        )
+
+    @Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self._message_store.delete([payload.message_id])
+
+    @Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        self._message_store.delete(list(payload.message_ids))
+
+
+def setup(bot: Bot):
+    return bot.add_cog(MessageStoreSync(bot))
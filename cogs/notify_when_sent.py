@@ -1,7 +1,9 @@
+import heapq
 import logging
 import os
+import time
 from enum import Enum
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Tuple
 
 from discord import Message, Embed
 from discord.abc import GuildChannel
@@ -13,14 +15,18 @@ from discord_ext_commands_coghelper import (
     ChannelNotFoundError,
 )
 from discord_ext_commands_coghelper.utils import get_bool
-
-from gspread.worksheet import Worksheet
+from gspread.utils import rowcol_to_a1
 
 from cogs.constant import Constant
+from utils.debouncer import Debouncer
+from utils.dm_dispatcher import DMDispatcher
 from utils.gspread_client import (
+    TEMPLATE_SHEET,
+    AsyncWorksheet,
     GSpreadClient,
-    get_or_add_worksheet,
-    duplicate_template_sheet,
+    appended_row,
+    background_priority,
+    values_to_records,
 )
 
 logger = logging.getLogger(__name__)
@@ -40,6 +46,12 @@ class _NotRegisterError(ExecutionError):
 
 class _Constant(Constant):
     SHEET_ID = os.environ["NOTIFY_WHEN_SENT_SHEET_ID"]
+    # まとめて通知する際に載せるリンクの最大数 ※embedのdescriptionの文字数制限があるため
+    DIGEST_MAX_LINKS = 20
+
+
+# シートの列 ※windowは後から追加したので、テンプレートから複製済みの古いシートには無い
+_FIELDNAMES = ["user_id", "channel_id", "is_valid", "window"]
 
 
 class _Mode(Enum):
@@ -51,14 +63,23 @@ class _Mode(Enum):
 
 
 class _Record:
-    def __init__(self, user_id: int, channel_id: int, is_valid: bool):
+    def __init__(self, user_id: int, channel_id: int, is_valid: bool, window: int = 0):
         self._user_id = user_id
         self._channel_id = channel_id
         self._is_valid = is_valid
+        self._window = window
+        # シート上の行番号 ※まだ書き込んでいなければNone
+        self._row: Optional[int] = None
+
+    def update_row(self, row: int):
+        self._row = row
 
     def update_is_valid(self, is_valid: bool):
         self._is_valid = is_valid
 
+    def update_window(self, window: int):
+        self._window = window
+
     @property
     def user_id(self) -> int:
         return self._user_id
@@ -71,22 +92,53 @@ class _Record:
     def is_valid(self) -> bool:
         return self._is_valid
 
+    @property
+    def row(self) -> Optional[int]:
+        return self._row
+
+    @property
+    def window(self) -> int:
+        """この秒数以内に続いたメッセージはまとめて通知する ※0ならメッセージ毎に通知する"""
+        return self._window
+
     def to_list(self) -> List[str]:
-        return [str(self._user_id), str(self._channel_id), str(self._is_valid)]
+        return [
+            str(self._user_id),
+            str(self._channel_id),
+            str(self._is_valid),
+            str(self._window),
+        ]
 
     @classmethod
     def from_dict(cls, dic: dict):
-        return cls(int(dic["user_id"]), int(dic["channel_id"]), bool(dic["is_valid"]))
+        # "False"もboolでは真になるので文字列で判定する
+        is_valid = str(dic["is_valid"]).upper() == "TRUE"
+        # window列が無い古いシートでは0とする
+        window = int(dic.get("window") or 0)
+        return cls(int(dic["user_id"]), int(dic["channel_id"]), is_valid, window)
 
 
 class NotifyWhenSent(Cog, CogHelper):
     def __init__(self, bot: Bot):
         CogHelper.__init__(self, bot)
         self._gspread_client = GSpreadClient()
-        self._records: Dict[int, List[_Record]] = {}
+        self._dm_dispatcher = DMDispatcher()
+        # (guild_id, channel_id, user_id)毎に続いたメッセージをまとめる
+        self._debouncer = Debouncer(self._send_digest)
+        # サーバー毎の登録内容 {guild_id: {(user_id, channel_id): _Record}}
+        self._records: Dict[int, Dict[Tuple[int, int], _Record]] = {}
+        # メッセージ毎に全件を走査しないように有効な通知先をチャンネル毎に引けるようにしておく
+        self._subscribers: Dict[Tuple[int, int], Set[int]] = {}
+        # 削除して空いたシートの行番号 ※登録時に小さい順に再利用する
+        self._free_rows: Dict[int, List[int]] = {}
         self._mode: _Mode
         self._channel_id: int
         self._list_all: bool
+        self._window: Optional[int]
+
+    def cog_unload(self):
+        self._dm_dispatcher.close()
+        self._debouncer.close()
 
     @command()
     async def notify_when_sent(self, ctx, *args):
@@ -94,13 +146,34 @@ class NotifyWhenSent(Cog, CogHelper):
 
     @Cog.listener()
     async def on_ready(self):
-        workbook = self._gspread_client.open_by_key(_Constant.SHEET_ID)
-        for guild in self.bot.guilds:
-            sheet_name = str(guild.id)
-            worksheet = get_or_add_worksheet(
-                workbook, sheet_name, duplicate_template_sheet
+        # 再接続でも呼ばれるので読み込み済みのサーバーは読み直さない
+        guild_ids = [
+            guild.id for guild in self.bot.guilds if guild.id not in self._records
+        ]
+        if len(guild_ids) == 0:
+            return
+
+        started_at = time.monotonic()
+        with background_priority():
+            # 全サーバーのシートをまとめて読み込む
+            values = await self._gspread_client.warm_up(
+                _Constant.SHEET_ID, [str(guild_id) for guild_id in guild_ids]
             )
-            self._get_records(worksheet, guild.id)
+            for guild_id in guild_ids:
+                # 待っている間にコマンドで読み込まれていたらそちらを使う
+                if guild_id in self._records:
+                    continue
+                if str(guild_id) in values:
+                    await self._load_records(guild_id, values[str(guild_id)])
+                else:
+                    # シートが無いサーバーと、読み込みが始まった後に参加したサーバーは個別に読み込む
+                    await self._get_records(
+                        await self._get_worksheet(guild_id), guild_id
+                    )
+        logger.info(
+            f"load records, guilds={len(guild_ids)}, "
+            f"elapsed={time.monotonic() - started_at:.2f}s"
+        )
 
     @Cog.listener()
     async def on_message(self, message: Message):
@@ -109,24 +182,52 @@ class NotifyWhenSent(Cog, CogHelper):
         if not message.guild:
             return
 
-        records = [
-            record
-            for record in self._records[message.guild.id]
-            if record.user_id == message.author.id
-            and record.channel_id == message.channel.id
-            and record.is_valid
-        ]
-        for record in records:
-            member = message.guild.get_member(record.user_id)
+        user_ids = self._subscribers.get((message.guild.id, message.channel.id), set())
+        for user_id in list(user_ids):
+            # 自分の送信したメッセージは通知しない
+            if user_id == message.author.id:
+                continue
+            member = message.guild.get_member(user_id)
             if not member:
                 continue
 
+            record = self._records[message.guild.id][(user_id, message.channel.id)]
+            if record.window > 0:
+                key = (message.guild.id, message.channel.id, user_id)
+                # 窓が開いている間のメッセージは窓の終わりにまとめて通知する
+                if not self._debouncer.push(key, message.jump_url, record.window):
+                    continue
+
             logger.debug(f"notify, user={member}, message={message}")
             embed = Embed(
                 title=f"#{message.channel.name}({message.guild.name})にメッセージの送信がありました",
                 description=f"{message.jump_url}",
             )
-            await member.send(embed=embed)
+            # 送信は待たずにワーカーに任せる
+            self._dm_dispatcher.submit(member, embed=embed)
+
+    def _send_digest(self, key: Tuple[int, int, int], jump_urls: List[str]):
+        guild_id, channel_id, user_id = key
+        # 窓が開いている間に通知を止めていたら送らない
+        if user_id not in self._subscribers.get((guild_id, channel_id), set()):
+            return
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+        channel = guild.get_channel(channel_id)
+        member = guild.get_member(user_id)
+        if channel is None or member is None:
+            return
+
+        logger.debug(f"notify digest, user={member}, messages={len(jump_urls)}")
+        lines = jump_urls[: _Constant.DIGEST_MAX_LINKS]
+        if len(jump_urls) > len(lines):
+            lines.append(f"他{len(jump_urls) - len(lines)}件")
+        embed = Embed(
+            title=f"#{channel.name}({guild.name})に{len(jump_urls)}件のメッセージの送信がありました",
+            description="\n".join(lines),
+        )
+        self._dm_dispatcher.submit(member, embed=embed)
 
     def _parse_args(self, ctx: Context, args: Dict[str, str]):
         if "register" in args:
@@ -155,6 +256,15 @@ class NotifyWhenSent(Cog, CogHelper):
         except ValueError:
             raise ArgumentError(ctx, channel="チャンネルIDの指定が正しくありません")
 
+        self._window = None
+        if "window" in args:
+            try:
+                self._window = int(args["window"])
+            except ValueError:
+                raise ArgumentError(ctx, window="秒数の指定が正しくありません")
+            if self._window < 0:
+                raise ArgumentError(ctx, window="0以上の秒数を指定してください")
+
     async def _execute(self, ctx: Context):
         if not ctx.guild:
             raise ExecutionError(ctx, title="このBOTが参加しているサーバー内で実行してください")
@@ -162,10 +272,11 @@ class NotifyWhenSent(Cog, CogHelper):
         if self._mode != _Mode.LIST and not ctx.guild.get_channel(self._channel_id):
             raise ChannelNotFoundError(ctx, self._channel_id)
 
-        workbook = self._gspread_client.open_by_key(_Constant.SHEET_ID)
-        sheet_name = str(ctx.guild.id)
-        worksheet = get_or_add_worksheet(workbook, sheet_name, duplicate_template_sheet)
-        self._get_records(worksheet, ctx.guild.id)
+        # 読み込み済みであればメモリ上の登録内容を正とし、シートは読み直さない
+        if ctx.guild.id not in self._records:
+            await self._get_records(
+                await self._get_worksheet(ctx.guild.id), ctx.guild.id
+            )
 
         if self._mode == _Mode.REGISTER:
             await self._execute_register(ctx)
@@ -178,16 +289,16 @@ class NotifyWhenSent(Cog, CogHelper):
         elif self._mode == _Mode.LIST:
             await self._execute_list(ctx)
 
-        self._set_records(worksheet, ctx.guild.id)
-
     async def _execute_register(self, ctx: Context):
         channel = ctx.guild.get_channel(self._channel_id)
         if self._find_record(ctx.guild.id, ctx.author.id, self._channel_id):
             raise _AlreadyRegisteredError(ctx, channel)
         else:
-            record = _Record(ctx.author.id, self._channel_id, True)
-            self._records[ctx.guild.id].append(record)
+            window = self._window if self._window is not None else 0
+            record = _Record(ctx.author.id, self._channel_id, True, window)
+            self._add_record(ctx.guild.id, record)
             logger.debug(f"record={record}")
+            await self._write_record(ctx.guild.id, record)
             await ctx.send(f"{channel.mention} を通知対象として登録しました")
 
     async def _execute_delete(self, ctx: Context):
@@ -196,8 +307,9 @@ class NotifyWhenSent(Cog, CogHelper):
         if not record:
             raise _NotRegisterError(ctx, channel)
         else:
-            self._records[ctx.guild.id].remove(record)
+            self._remove_record(ctx.guild.id, record)
             logger.debug(f"record={record}")
+            await self._clear_record(ctx.guild.id, record)
             await ctx.send(f"{channel.mention} の通知設定を削除しました")
 
     async def _execute_enable(self, ctx: Context):
@@ -207,7 +319,10 @@ class NotifyWhenSent(Cog, CogHelper):
             raise _NotRegisterError(ctx, channel)
         else:
             logger.debug(f"record={record}")
-            record.update_is_valid(True)
+            self._update_is_valid(ctx.guild.id, record, True)
+            if self._window is not None:
+                record.update_window(self._window)
+            await self._write_record(ctx.guild.id, record)
             await ctx.send(f"{channel.mention} の通知設定を有効にしました")
 
     async def _execute_disable(self, ctx: Context):
@@ -217,7 +332,8 @@ class NotifyWhenSent(Cog, CogHelper):
             raise _NotRegisterError(ctx, channel)
         else:
             logger.debug(f"record={record}")
-            record.update_is_valid(False)
+            self._update_is_valid(ctx.guild.id, record, False)
+            await self._write_record(ctx.guild.id, record)
             await ctx.send(f"{channel.mention} の通知設定を無効にしました")
 
     async def _execute_list(self, ctx: Context):
@@ -225,37 +341,122 @@ class NotifyWhenSent(Cog, CogHelper):
             title=f"{ctx.author.display_name} の通知一覧",
             description=f"サーバー名: {ctx.guild.name}",
         )
-        for record in self._records[ctx.guild.id]:
+        for record in self._records[ctx.guild.id].values():
             if not self._list_all and record.user_id != ctx.author.id:
                 continue
             channel = ctx.guild.get_channel(record.channel_id)
             state = "有効" if record.is_valid else "無効"
+            value = f"通知状態: {state}"
+            if record.window > 0:
+                value += f", まとめて通知: {record.window}秒"
             embed.add_field(
                 name=f"チャンネル名: {channel.name}",
-                value=f"通知状態: {state}",
+                value=value,
                 inline=False,
             )
         await ctx.send(embed=embed)
 
-    def _find_record(self, guild_id: int, user_id: int, channel_id: int) -> _Record:
-        records = [
-            record
-            for record in self._records[guild_id]
-            if int(record.user_id) == user_id and int(record.channel_id) == channel_id
-        ]
-        return records[0] if len(records) > 0 else None
+    def _find_record(
+        self, guild_id: int, user_id: int, channel_id: int
+    ) -> Optional[_Record]:
+        return self._records.get(guild_id, {}).get((user_id, channel_id))
+
+    def _add_record(self, guild_id: int, record: _Record):
+        records = self._records.setdefault(guild_id, {})
+        records[(record.user_id, record.channel_id)] = record
+        if record.is_valid:
+            self._subscribers.setdefault((guild_id, record.channel_id), set()).add(
+                record.user_id
+            )
+
+    def _remove_record(self, guild_id: int, record: _Record):
+        del self._records[guild_id][(record.user_id, record.channel_id)]
+        self._unsubscribe(guild_id, record)
+        self._debouncer.discard((guild_id, record.channel_id, record.user_id))
+
+    def _update_is_valid(self, guild_id: int, record: _Record, is_valid: bool):
+        record.update_is_valid(is_valid)
+        if is_valid:
+            self._subscribers.setdefault((guild_id, record.channel_id), set()).add(
+                record.user_id
+            )
+        else:
+            self._unsubscribe(guild_id, record)
+            self._debouncer.discard((guild_id, record.channel_id, record.user_id))
+
+    def _unsubscribe(self, guild_id: int, record: _Record):
+        key = (guild_id, record.channel_id)
+        user_ids = self._subscribers.get(key)
+        if user_ids is None:
+            return
+        user_ids.discard(record.user_id)
+        if len(user_ids) == 0:
+            del self._subscribers[key]
 
-    def _set_records(self, worksheet: Worksheet, guild_id: int):
-        rows = worksheet.get_all_records()
-        worksheet.delete_rows(2, len(rows) + 2)
-        worksheet.insert_rows(
-            [record.to_list() for record in self._records[guild_id]], 2
+    async def _get_worksheet(self, guild_id: int) -> AsyncWorksheet:
+        return await self._gspread_client.get_or_add_worksheet(
+            _Constant.SHEET_ID, str(guild_id), template=TEMPLATE_SHEET
         )
 
-    def _get_records(self, worksheet: Worksheet, guild_id: int):
-        self._records[guild_id] = [
-            _Record.from_dict(record) for record in worksheet.get_all_records()
-        ]
+    async def _write_record(self, guild_id: int, record: _Record):
+        # 変更のあった1行だけを書き込む
+        worksheet = await self._get_worksheet(guild_id)
+        values = record.to_list()
+        free_rows = self._free_rows.get(guild_id, [])
+        if record.row is None and len(free_rows) > 0:
+            record.update_row(heapq.heappop(free_rows))
+        if record.row is not None:
+            await worksheet.update(_row_range(record.row, len(values)), [values])
+            return
+        # 空いている行が無ければ末尾に追加し、追加された行番号を覚えておく
+        response = await worksheet.append_rows([values], table_range="A1")
+        record.update_row(appended_row(response))
+
+    async def _clear_record(self, guild_id: int, record: _Record):
+        if record.row is None:
+            return
+        # 行を削除すると以降の行番号がずれるので、中身だけ消して空き行として再利用する
+        worksheet = await self._get_worksheet(guild_id)
+        await worksheet.batch_clear([_row_range(record.row, len(record.to_list()))])
+        heapq.heappush(self._free_rows.setdefault(guild_id, []), record.row)
+
+    async def _get_records(self, worksheet: AsyncWorksheet, guild_id: int):
+        await self._load_records(guild_id, await worksheet.get_values())
+
+    async def _load_records(self, guild_id: int, values: List[List[str]]):
+        header = values[0] if len(values) > 0 else []
+        # 古いシートはwindow列のヘッダーが無く値が読み捨てられるので、列を揃えて読み込む
+        migrate = 0 < len(header) < len(_FIELDNAMES) and (
+            header == _FIELDNAMES[: len(header)]
+        )
+        rows = _parse_records(_FIELDNAMES if migrate else header, values[1:])
+
+        # 読み込み直す前の登録内容は通知先から外す
+        for record in self._records.pop(guild_id, {}).values():
+            self._unsubscribe(guild_id, record)
+        self._records[guild_id] = {}
+        self._free_rows[guild_id] = []
+        # 1行目はヘッダーなので2行目から
+        for row_number, row in enumerate(rows, 2):
+            if row["user_id"] == "":
+                self._free_rows[guild_id].append(row_number)
+                continue
+            record = _Record.from_dict(row)
+            record.update_row(row_number)
+            self._add_record(guild_id, record)
+
+        if migrate:
+            logger.info(f"migrate header, guild={guild_id}, header={header}")
+            worksheet = await self._get_worksheet(guild_id)
+            await worksheet.update(_row_range(1, len(_FIELDNAMES)), [_FIELDNAMES])
+
+
+def _parse_records(header: List[str], rows: List[List[str]]) -> List[dict]:
+    return values_to_records([header] + rows)
+
+
+def _row_range(row: int, columns: int) -> str:
+    return f"A{row}:{rowcol_to_a1(row, columns)}"
 
 
 def setup(bot: Bot):
@@ -15,6 +15,8 @@ class Constant(utils.constant.Constant):
         "dispander",
         "discord_emoji_ranking",
         "cogs.get_system_info",
+        "cogs.message_store_sync",
+        "cogs.member_directory_sync",
         "cogs.message_count",
         "cogs.download_messages_json",
         "cogs.mention_to_reaction_users",
@@ -50,6 +52,7 @@ class DiscordBot(commands.Bot):
             self.load_extension(cog)
         init_logger(__name__)
         init_logger("cogs")
+        init_logger("utils")
         init_logger("discord_emoji_ranking")
         init_logger("discord_ext_commands_coghelper")
         self._logger = logging.getLogger(__name__)
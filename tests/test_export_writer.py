@@ -0,0 +1,41 @@
+import gzip
+import io
+import json
+
+import discord
+
+from utils.export_writer import ExportFormat, RecordWriter
+
+
+def _read(part) -> bytes:
+    # discord.Fileに渡せて、先頭から読み直せること
+    file = discord.File(part, "part.json")
+    assert isinstance(part, io.IOBase)
+    data = file.fp.read()
+    part.close()
+    return data
+
+
+def test_record_writer_splits_into_readable_parts():
+    writer = RecordWriter(ExportFormat.JSON, 2048)
+    records = [{"id": i, "text": "x" * 100} for i in range(30)]
+    for record in records:
+        writer.write(record)
+    parts = writer.close()
+
+    assert len(parts) > 1
+    loaded = []
+    for part in parts:
+        data = _read(part)
+        assert len(data) <= 2048
+        loaded.extend(json.loads(data))
+    assert loaded == records
+
+
+def test_record_writer_compresses_parts():
+    writer = RecordWriter(ExportFormat.NDJSON, 8 * 1024 * 1024, compression="gzip")
+    writer.write({"id": 1})
+    parts = writer.close()
+
+    assert len(parts) == 1
+    assert json.loads(gzip.decompress(_read(parts[0]))) == {"id": 1}
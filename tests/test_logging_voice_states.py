@@ -0,0 +1,80 @@
+from cogs.logging_voice_states import _SessionAggregator
+
+
+def _record(state: str, user_id: int = 1, channel_id: int = 10) -> dict:
+    return {"user_id": user_id, "channel_id": channel_id, "state": state}
+
+
+def _never_active(user_id, kind, channel_id) -> bool:
+    return False
+
+
+def test_session_joined_before_lookback_is_counted_from_start():
+    aggregator = _SessionAggregator(1000.0, 5000.0)
+    # 参加の記録は遡って読み込んだ範囲より前にある
+    aggregator.feed(2000.0, _record("mute_on"))
+    aggregator.feed(3000.0, _record("leave,stream_end"))
+    aggregator.finish(6000.0, _never_active)
+
+    totals = aggregator.totals[1][10]
+    assert totals["sessions"] == 1
+    assert totals["voice"] == 2000.0
+    assert totals["stream"] == 2000.0
+    assert totals["video"] == 0.0
+
+
+def test_session_joined_within_lookback_is_clipped_to_start():
+    aggregator = _SessionAggregator(1000.0, 5000.0)
+    aggregator.feed(500.0, _record("join"))
+    aggregator.feed(1500.0, _record("leave"))
+    aggregator.finish(6000.0, _never_active)
+
+    assert aggregator.totals[1][10]["voice"] == 500.0
+
+
+def test_move_without_join_does_not_open_implicit_session():
+    aggregator = _SessionAggregator(1000.0, 5000.0)
+    aggregator.feed(2000.0, _record("move", channel_id=20))
+    aggregator.feed(2500.0, _record("leave", channel_id=20))
+    aggregator.finish(6000.0, _never_active)
+
+    assert list(aggregator.totals[1].keys()) == [20]
+    assert aggregator.totals[1][20]["voice"] == 500.0
+
+
+def test_unrecorded_leave_is_closed_at_last_record_with_before():
+    aggregator = _SessionAggregator(None, 100000.0)
+    aggregator.feed(1000.0, _record("join"))
+    aggregator.feed(2000.0, _record("mute_on"))
+    aggregator.finish(200000.0, _never_active)
+
+    assert aggregator.totals[1][10]["voice"] == 1000.0
+
+
+def test_session_open_at_before_is_closed_by_later_record():
+    aggregator = _SessionAggregator(None, 5000.0)
+    aggregator.feed(1000.0, _record("join"))
+    aggregator.feed(6000.0, _record("leave"))
+    aggregator.finish(200000.0, _never_active)
+
+    assert aggregator.totals[1][10]["voice"] == 4000.0
+    assert not aggregator.has_open_spans
+
+
+def test_records_after_before_do_not_open_sessions():
+    aggregator = _SessionAggregator(1000.0, 5000.0)
+    aggregator.feed(6000.0, _record("join"))
+    aggregator.feed(7000.0, _record("leave"))
+    aggregator.finish(200000.0, _never_active)
+
+    assert aggregator.totals == {}
+
+
+def test_move_with_stream_end_does_not_book_stream_to_destination():
+    aggregator = _SessionAggregator(1000.0, 5000.0)
+    aggregator.feed(2000.0, _record("move,stream_end", channel_id=20))
+    aggregator.feed(2500.0, _record("leave", channel_id=20))
+    aggregator.finish(6000.0, _never_active)
+
+    assert aggregator.totals[1][20]["voice"] == 500.0
+    assert aggregator.totals[1][20]["stream"] == 0.0
@@ -0,0 +1,113 @@
+import asyncio
+import datetime
+import types
+
+import pytest
+from discord.utils import time_snowflake
+
+from utils import message_store
+from utils.message_store import MessageStore
+
+_NOW = datetime.datetime(2026, 1, 15, 12)
+
+
+class _FakeChannel:
+    def __init__(self, channel_id: int):
+        self.id = channel_id
+        self.messages = []
+
+    def post(self, created_at: datetime.datetime):
+        author = types.SimpleNamespace(
+            id=1, name="user", display_name="user", bot=False
+        )
+        self.messages.append(
+            types.SimpleNamespace(
+                id=time_snowflake(created_at),
+                channel=self,
+                author=author,
+                webhook_id=None,
+                created_at=created_at,
+                edited_at=None,
+                content="",
+            )
+        )
+
+    async def history(self, limit=None, after=None, oldest_first=True):
+        for message in sorted(self.messages, key=lambda m: m.id):
+            if after is None or message.id > after.id:
+                yield message
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [_NOW]
+
+    class _Datetime(datetime.datetime):
+        @classmethod
+        def utcnow(cls):
+            return now[0]
+
+    monkeypatch.setattr(
+        message_store,
+        "datetime",
+        types.SimpleNamespace(datetime=_Datetime, timedelta=datetime.timedelta),
+    )
+    return now
+
+
+@pytest.fixture
+def store(monkeypatch):
+    monkeypatch.setenv("MESSAGE_STORE_FILE", ":memory:")
+    monkeypatch.delenv("MESSAGE_STORE_RETENTION_DAYS", raising=False)
+    if hasattr(MessageStore, "_instance"):
+        monkeypatch.delattr(MessageStore, "_instance")
+    yield MessageStore()
+    if hasattr(MessageStore, "_instance"):
+        del MessageStore._instance
+
+
+def _stored_ids(store: MessageStore, channel: _FakeChannel):
+    async def collect():
+        return [m.id async for m in store.iter_messages(channel.id, None, None)]
+
+    return asyncio.run(collect())
+
+
+@pytest.mark.parametrize("next_before", [datetime.datetime(2026, 2, 1), None])
+def test_sync_with_future_before_fetches_later_messages(store, clock, next_before):
+    channel = _FakeChannel(time_snowflake(_NOW - datetime.timedelta(days=10)))
+    channel.post(_NOW - datetime.timedelta(hours=1))
+    asyncio.run(store.sync(channel, datetime.datetime(2026, 2, 1), None))
+
+    # 同期済みの範囲は現在時刻までになる
+    _, synced_before = store._get_synced_range(channel.id)
+    assert synced_before == time_snowflake(_NOW, high=True)
+
+    # 1回目の同期の後に投稿されたメッセージ
+    clock[0] = _NOW + datetime.timedelta(hours=2)
+    channel.post(_NOW + datetime.timedelta(hours=1))
+    asyncio.run(store.sync(channel, next_before, None))
+
+    assert _stored_ids(store, channel) == [m.id for m in channel.messages]
+    _, synced_before = store._get_synced_range(channel.id)
+    assert synced_before == time_snowflake(clock[0], high=True)
+
+
+def test_sync_fetches_only_outside_synced_range(store, clock):
+    channel = _FakeChannel(time_snowflake(_NOW - datetime.timedelta(days=10)))
+    channel.post(_NOW - datetime.timedelta(days=2))
+    channel.post(_NOW - datetime.timedelta(hours=1))
+    after = _NOW - datetime.timedelta(days=1)
+    asyncio.run(store.sync(channel, None, after))
+    assert store._get_synced_range(channel.id) == (
+        time_snowflake(after, high=True),
+        time_snowflake(_NOW, high=True),
+    )
+
+    # 保存済みの範囲より前だけを取得して範囲を広げる
+    asyncio.run(store.sync(channel, None, None))
+    assert _stored_ids(store, channel) == [m.id for m in channel.messages]
+    assert store._get_synced_range(channel.id) == (
+        channel.id,
+        time_snowflake(_NOW, high=True),
+    )
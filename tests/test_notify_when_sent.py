@@ -0,0 +1,67 @@
+import asyncio
+import os
+
+os.environ.setdefault("NOTIFY_WHEN_SENT_SHEET_ID", "dummy")
+
+from cogs.notify_when_sent import NotifyWhenSent, _FIELDNAMES, _Record  # noqa: E402
+
+
+class _FakeWorksheet:
+    def __init__(self):
+        self.updates = []
+
+    async def update(self, range_name, values):
+        self.updates.append((range_name, values))
+
+
+def _create_cog(worksheet: _FakeWorksheet) -> NotifyWhenSent:
+    # シートに接続しないように初期化は必要な属性だけにする
+    cog = NotifyWhenSent.__new__(NotifyWhenSent)
+    cog._records = {}
+    cog._subscribers = {}
+    cog._free_rows = {}
+
+    async def get_worksheet(guild_id):
+        return worksheet
+
+    cog._get_worksheet = get_worksheet
+    return cog
+
+
+def test_load_records_migrates_header_without_window():
+    record = _Record(1, 2, True, 30)
+    worksheet = _FakeWorksheet()
+    cog = _create_cog(worksheet)
+
+    # window列のヘッダーが無い古いシートに書き込まれた行
+    values = [_FIELDNAMES[:3], record.to_list(), ["", "", "", ""]]
+    asyncio.run(cog._load_records(100, values))
+
+    loaded = cog._records[100][(1, 2)]
+    assert loaded.to_list() == record.to_list()
+    assert loaded.row == 2
+    assert cog._free_rows[100] == [3]
+    assert cog._subscribers[(100, 2)] == {1}
+    assert worksheet.updates == [("A1:D1", [_FIELDNAMES])]
+
+
+def test_load_records_keeps_current_header():
+    record = _Record(1, 2, False, 0)
+    worksheet = _FakeWorksheet()
+    cog = _create_cog(worksheet)
+
+    asyncio.run(cog._load_records(100, [_FIELDNAMES, record.to_list()]))
+
+    assert cog._records[100][(1, 2)].to_list() == record.to_list()
+    assert (100, 2) not in cog._subscribers
+    assert worksheet.updates == []
+
+
+def test_load_records_does_not_migrate_empty_sheet():
+    worksheet = _FakeWorksheet()
+    cog = _create_cog(worksheet)
+
+    asyncio.run(cog._load_records(100, []))
+
+    assert cog._records[100] == {}
+    assert worksheet.updates == []
@@ -0,0 +1,88 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Debouncer:
+    """キー毎に最初の要素はすぐに通し、それからwindow秒以内に続いた要素はまとめて窓の終わりに渡す
+
+    まとめて渡した後も同じ長さの窓を開き直すので、続いている間はwindow秒に1回にまとめられる
+    窓の期限はヒープで管理し、1つのタスクで一番近い期限だけを待つ
+    """
+
+    def __init__(self, flush_func: Callable[[Hashable, List[Any]], None]):
+        self._flush_func = flush_func
+        # 開いている窓 {key: (窓の長さ, 溜まっている要素, ヒープの要素の通し番号)}
+        self._windows: Dict[Hashable, Tuple[float, List[Any], int]] = {}
+        self._deadlines: List[Tuple[float, int, Hashable]] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+    def push(self, key: Hashable, item: Any, window: float) -> bool:
+        """itemをすぐに通す場合はTrue、窓の終わりにまとめる場合はFalseを返す"""
+        if key in self._windows:
+            self._windows[key][1].append(item)
+            return False
+        self._open(key, window)
+        return True
+
+    def discard(self, key: Hashable):
+        # 溜まっている要素は捨てる ※ヒープに残った期限は通し番号が一致しないので取り出した時に無視される
+        self._windows.pop(key, None)
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def _open(self, key: Hashable, window: float):
+        # イベントループが動いてから作る必要があるので初回に起動する
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        sequence = next(self._sequence)
+        self._windows[key] = (window, [], sequence)
+        deadline = time.monotonic() + window
+        heapq.heappush(self._deadlines, (deadline, sequence, key))
+        if self._deadlines[0][1] == sequence:
+            # 一番近い期限が変わったので待ち直させる
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            if len(self._deadlines) == 0:
+                delay = None
+            else:
+                delay = self._deadlines[0][0] - time.monotonic()
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            _, sequence, key = heapq.heappop(self._deadlines)
+            entry = self._windows.get(key)
+            if entry is None or entry[2] != sequence:
+                continue
+            del self._windows[key]
+            window, items, _ = entry
+            if len(items) == 0:
+                continue
+            try:
+                self._flush_func(key, items)
+            except Exception as e:
+                logger.error(
+                    f"failed to flush, key={key}, items={len(items)}, error={e}"
+                )
+            self._open(key, window)
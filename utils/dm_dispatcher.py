@@ -0,0 +1,99 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from utils.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class DMDispatcher(Singleton):
+    """DMの送信をキューに積み、イベントの処理とは別のワーカーで並行して送信する
+
+    DMはスパム判定されやすいのでワーカー全体で送信間隔を空けて、1秒あたりの送信数を制限する
+    キューには上限があり、溢れた場合は古いものを送るために新しいDMを捨てる
+    """
+
+    def __init__(self):
+        # Singletonなので初期化は一度だけ
+        if hasattr(self, "_queue"):
+            return
+        self._worker_count = int(os.environ.get("DM_DISPATCHER_WORKERS", "4"))
+        self._interval = 1 / float(os.environ.get("DM_DISPATCHER_RATE", "5"))
+        self._queue_size = int(os.environ.get("DM_DISPATCHER_QUEUE_SIZE", "1000"))
+        self._queue: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        self._next_at = 0.0
+        self._stats = dict(
+            sent=0, failed=0, dropped=0, latency=0.0, max_latency=0.0, send_time=0.0
+        )
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        # 平均は送信済みの件数で割る
+        done = stats["sent"] + stats["failed"]
+        stats["latency"] = stats["latency"] / done if done > 0 else 0.0
+        stats["send_time"] = stats["send_time"] / done if done > 0 else 0.0
+        stats["queued"] = self._queue.qsize() if self._queue is not None else 0
+        return stats
+
+    def submit(self, user: discord.abc.User, **kwargs):
+        """userへのDMの送信を予約する ※kwargsはsend()の引数"""
+        # イベントループが動いてから作る必要があるので初回の送信時に起動する
+        if len(self._workers) == 0:
+            self._start()
+        try:
+            self._queue.put_nowait((user, kwargs, time.monotonic()))
+        except asyncio.QueueFull:
+            logger.warning(f"dm queue is full, drop dm, user={user}")
+            self._stats["dropped"] += 1
+
+    def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        self._workers = []
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue(maxsize=self._queue_size)
+        self._workers = [
+            loop.create_task(self._work()) for _ in range(self._worker_count)
+        ]
+
+    async def _work(self):
+        while True:
+            user, kwargs, enqueued_at = await self._queue.get()
+            started_at = time.monotonic()
+            try:
+                await self._wait_turn()
+                # DMチャンネルはdiscord.py側でユーザー毎にキャッシュされている
+                channel = user.dm_channel or await user.create_dm()
+                await channel.send(**kwargs)
+                self._stats["sent"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # DMを拒否しているユーザーなどは送信できないので記録だけして次に進む
+                logger.warning(f"failed to send dm, user={user}, error={e}")
+                self._stats["failed"] += 1
+            finally:
+                self._queue.task_done()
+            finished_at = time.monotonic()
+            latency = finished_at - enqueued_at
+            self._stats["latency"] += latency
+            self._stats["max_latency"] = max(self._stats["max_latency"], latency)
+            self._stats["send_time"] += finished_at - started_at
+
+    async def _wait_turn(self):
+        # 送信の開始時刻を一定間隔ずつずらす ※時刻の予約だけを先に行い、待っている間も他のワーカーが予約できるようにする
+        now = time.monotonic()
+        start_at = max(now, self._next_at)
+        self._next_at = start_at + self._interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
@@ -0,0 +1,272 @@
+import csv
+import gzip
+import io
+import json
+import tempfile
+import textwrap
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+import discord
+from discord.ext.commands import Context
+from discord_ext_commands_coghelper import ArgumentError
+
+# メモリ上に保持するサイズ ※これを超えたら一時ファイルに書き出される
+_SPOOL_SIZE = 1024 * 1024
+# 圧縮の終端やmultipartのヘッダー分の余裕
+_MARGIN = 1024
+
+
+class ExportPart(io.RawIOBase):
+    """分割したパート1つ分のファイル
+
+    小さいうちはメモリ上に保持するSpooledTemporaryFileを、discord.Fileに渡せるio.IOBaseとして扱う
+    ※Python3.8のSpooledTemporaryFileはio.IOBaseではない
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._file = tempfile.SpooledTemporaryFile(max_size=_SPOOL_SIZE)
+
+    def readable(self) -> bool:
+        return True
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self._file.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+    def write(self, data) -> int:
+        return self._file.write(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self._file.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self._file.tell()
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+        super().close()
+
+
+class SplitFileWriter:
+    """要素を逐次書き出し、各パートがlimitバイト以下になるように分割する
+
+    各パートにはheaderとfooterが付くので、パート単体でも有効なファイルになる
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        header: bytes = b"",
+        separator: bytes = b"",
+        footer: bytes = b"",
+        compression: Optional[str] = None,
+        empty: Optional[bytes] = None,
+    ):
+        self._limit = limit
+        self._header = header
+        self._separator = separator
+        self._footer = footer
+        self._compression = compression
+        # 要素が1つも無かった場合に出力する内容 ※未指定ならheaderとfooterだけになる
+        self._empty = empty
+        self._parts: List[ExportPart] = []
+        self._raw: Optional[ExportPart] = None
+        self._file = None
+        # 圧縮器に渡したがまだ書き出されていないバイト数
+        self._pending = 0
+        self._count = 0
+
+    def write(self, data: bytes):
+        size = len(self._separator) + len(data)
+        if self._raw is not None and self._count > 0 and self._overflows(size):
+            self._close_part()
+        if self._raw is None:
+            self._open_part()
+        if self._count > 0:
+            self._put(self._separator)
+        self._put(data)
+        self._count += 1
+
+    def close(self) -> List[ExportPart]:
+        # 要素が無くても空のファイルを1つは出力する
+        if self._raw is None and len(self._parts) == 0:
+            if self._empty is not None:
+                self._header, self._footer = self._empty, b""
+            self._open_part()
+        if self._raw is not None:
+            self._close_part()
+        return self._parts
+
+    def _overflows(self, size: int) -> bool:
+        # 圧縮前のサイズで見積もって超えていなければそのまま書く
+        reserved = size + len(self._footer) + _MARGIN
+        if self._raw.tell() + self._pending + reserved <= self._limit:
+            return False
+        if self._pending == 0:
+            return True
+        # 圧縮済みのサイズを確定させて判定し直す
+        self._file.flush()
+        self._pending = 0
+        return self._raw.tell() + reserved > self._limit
+
+    def _put(self, data: bytes):
+        self._file.write(data)
+        if self._compression is not None:
+            self._pending += len(data)
+
+    def _open_part(self):
+        self._raw = ExportPart()
+        if self._compression == "gzip":
+            self._file = gzip.GzipFile(fileobj=self._raw, mode="wb")
+        elif self._compression == "zstd":
+            # zstdを使う場合だけ必要になるのでここでimportする
+            import zstandard
+
+            self._file = zstandard.ZstdCompressor().stream_writer(
+                self._raw, closefd=False
+            )
+        else:
+            self._file = self._raw
+        self._pending = 0
+        self._count = 0
+        self._put(self._header)
+
+    def _close_part(self):
+        self._put(self._footer)
+        if self._compression is not None:
+            # 圧縮の終端を書き出す ※元のファイルは閉じられない
+            self._file.close()
+        self._raw.seek(0)
+        self._parts.append(self._raw)
+        self._raw = None
+        self._file = None
+
+
+class ExportFormat(Enum):
+    JSON = "json"
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+_COMPRESSION_EXTENSIONS = {None: "", "gzip": ".gz", "zstd": ".zst"}
+
+
+def get_export_options(
+    ctx: Context, args: Dict[str, str]
+) -> (ExportFormat, Optional[str]):
+    try:
+        export_format = ExportFormat(args.get("format", "json").lower())
+    except ValueError:
+        raise ArgumentError(ctx, format="出力形式はjson/ndjson/csvのいずれかを指定してください")
+
+    compression = args.get("compress", "none").lower()
+    if compression == "none":
+        compression = None
+    if compression not in _COMPRESSION_EXTENSIONS:
+        raise ArgumentError(ctx, compress="圧縮形式はnone/gzip/zstdのいずれかを指定してください")
+    if compression == "zstd":
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            raise ArgumentError(ctx, compress="zstdを利用するにはzstandardのインストールが必要です")
+
+    return export_format, compression
+
+
+def _flatten(record: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    # CSVの列にするため入れ子の辞書は"user.id"のようなキーに展開する
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+class RecordWriter:
+    """辞書のレコードを指定の形式で逐次書き出す
+
+    default=での変換を挟まないように、値はjsonでそのまま扱える型に変換してから渡す
+    CSVの場合はfieldnamesに入れ子を展開した後の列名を指定する
+    """
+
+    def __init__(
+        self,
+        export_format: ExportFormat,
+        limit: int,
+        compression: Optional[str] = None,
+        fieldnames: Optional[List[str]] = None,
+    ):
+        self._format = export_format
+        self._fieldnames = fieldnames
+        self._extension = (
+            f".{export_format.value}{_COMPRESSION_EXTENSIONS[compression]}"
+        )
+        if export_format == ExportFormat.JSON:
+            # json.dump(indent=2)と同じ見た目になるように要素毎に書き出す
+            self._writer = SplitFileWriter(
+                limit, b"[\n", b",\n", b"\n]", compression=compression, empty=b"[]"
+            )
+        elif export_format == ExportFormat.NDJSON:
+            self._writer = SplitFileWriter(limit, compression=compression)
+        else:
+            # 各パートの先頭にヘッダー行を付ける
+            header = self._to_csv_line(dict(zip(fieldnames, fieldnames)))
+            self._writer = SplitFileWriter(limit, header, compression=compression)
+
+    @property
+    def extension(self) -> str:
+        return self._extension
+
+    def write(self, record: Dict[str, Any]):
+        if self._format == ExportFormat.JSON:
+            item = json.dumps(record, indent=2, ensure_ascii=False)
+            data = textwrap.indent(item, "  ").encode("utf-8")
+        elif self._format == ExportFormat.NDJSON:
+            item = json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+            data = f"{item}\n".encode("utf-8")
+        else:
+            data = self._to_csv_line(_flatten(record))
+        self._writer.write(data)
+
+    def close(self) -> List[ExportPart]:
+        return self._writer.close()
+
+    def _to_csv_line(self, row: Dict[str, Any]) -> bytes:
+        buffer = io.StringIO()
+        csv.DictWriter(buffer, self._fieldnames).writerow(row)
+        return buffer.getvalue().encode("utf-8")
+
+
+async def send_parts(
+    ctx: Context,
+    parts: List[ExportPart],
+    stem: str,
+    extension: str,
+    embed: Optional[discord.Embed] = None,
+):
+    # アップロードの上限はメッセージ単位なので1パートずつ送信する
+    try:
+        for index, part in enumerate(parts):
+            if len(parts) == 1:
+                filename = f"{stem}{extension}"
+            else:
+                filename = f"{stem}_part{index + 1}{extension}"
+            await ctx.send(
+                embed=embed if index == 0 else None,
+                file=discord.File(part, filename),
+            )
+    finally:
+        for part in parts:
+            part.close()
@@ -1,35 +1,332 @@
+import asyncio
+import contextlib
+import contextvars
+import functools
+import heapq
+import itertools
+import logging
 import os
-from typing import Callable
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from enum import IntEnum
+from typing import Any, Callable, Dict, Hashable, List, Optional
 
 import gspread
 from google.oauth2.service_account import Credentials
+from gspread.utils import a1_to_rowcol, absolute_range_name, numericise_all
 
 from utils.singleton import Singleton
 
+logger = logging.getLogger(__name__)
 
-def get_or_add_worksheet(
-    workbook: gspread.Spreadsheet,
-    name: str,
-    add_func: Callable[[gspread.Spreadsheet, str], gspread.Worksheet] = None,
-) -> gspread.Worksheet:
+
+# 新しいシートの複製元として使うシートの名前
+TEMPLATE_SHEET = "template"
+
+
+def values_to_records(values: List[List[Any]]) -> List[dict]:
+    """シートの値をget_all_records()と同じ形式に変換する ※1行目をヘッダーとする"""
+    if len(values) == 0:
+        return []
+    header = values[0]
+    width = max(len(row) for row in values)
+    records = []
+    for row in values[1:]:
+        row = row + [""] * (width - len(row))
+        records.append(dict(zip(header, numericise_all(row))))
+    return records
+
+
+def appended_row(response: dict) -> int:
+    """append_rows()のレスポンスから追加された最初の行番号を返す"""
+    # updatedRangeは'シート名'!A10:D10の形式
+    updated_range = response["updates"]["updatedRange"].split("!")[-1]
+    return a1_to_rowcol(updated_range.split(":")[0])[0]
+
+
+class Priority(IntEnum):
+    # 値が小さいほど先に実行される
+    INTERACTIVE = 0
+    BACKGROUND = 1
+
+
+_priority: contextvars.ContextVar = contextvars.ContextVar(
+    "gspread_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextlib.contextmanager
+def background_priority():
+    """このブロック内のリクエストをコマンドの応答よりも後回しにする"""
+    token = _priority.set(Priority.BACKGROUND)
     try:
-        return workbook.worksheet(name)
-    except gspread.exceptions.WorksheetNotFound:
-        if add_func is None:
-            return workbook.add_worksheet(name, rows=100, cols=100)
-        else:
-            return add_func(workbook, name)
+        yield
+    finally:
+        _priority.reset(token)
+
+
+# リトライの対象にするステータスコード ※サーバーエラーは処理済みの場合があるので冪等なリクエストだけ
+_THROTTLED_STATUS_CODE = 429
+_SERVER_ERROR_STATUS_CODES = {500, 502, 503, 504}
+
+
+class _RequestScheduler:
+    """Sheets APIのクォータを超えないようにリクエストを実行する
+
+    トークンバケットで1分あたりのリクエスト数を制限し、待ちが発生した場合は優先度の高い順に実行する
+    クォータ超過などの一時的なエラーはジッター付きの指数バックオフでリトライする
+    サーバーエラーは書き込みが反映されている場合があるので、冪等なリクエストだけリトライする
+    """
+
+    def __init__(
+        self,
+        executor: ThreadPoolExecutor,
+        quota_per_minute: int,
+        burst: int,
+        max_retries: int,
+        max_backoff: float,
+    ):
+        self._executor = executor
+        self._rate = quota_per_minute / 60
+        self._burst = burst
+        self._max_retries = max_retries
+        self._max_backoff = max_backoff
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._stats = dict(requests=0, retries=0, throttled=0, failures=0, waited=0.0)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats["queued"] = len(self._waiters)
+        return stats
+
+    async def run(
+        self, func: Callable, *args, idempotent: bool = False, **kwargs
+    ) -> Any:
+        """funcを実行する ※funcの中で送信するリクエストは1回だけにすること"""
+        loop = asyncio.get_running_loop()
+        priority = _priority.get()
+        attempt = 0
+        while True:
+            await self._acquire(priority)
+            self._stats["requests"] += 1
+            try:
+                return await loop.run_in_executor(
+                    self._executor, functools.partial(func, *args, **kwargs)
+                )
+            except gspread.exceptions.APIError as e:
+                status = e.response.status_code
+                retryable = status == _THROTTLED_STATUS_CODE or (
+                    idempotent and status in _SERVER_ERROR_STATUS_CODES
+                )
+                if not retryable or attempt >= self._max_retries:
+                    self._stats["failures"] += 1
+                    raise
+                if status == _THROTTLED_STATUS_CODE:
+                    # クォータを超えているので他のリクエストも含めて送信を控える
+                    self._stats["throttled"] += 1
+                    self._tokens = min(self._tokens, 0.0)
+                delay = random.uniform(0, min(self._max_backoff, 2**attempt))
+                logger.warning(
+                    f"retry gspread request, status={status}, "
+                    f"attempt={attempt + 1}, delay={delay:.2f}"
+                )
+                self._stats["retries"] += 1
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _acquire(self, priority: Priority):
+        started_at = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            # 既にトークンを受け取っていた場合は返却する
+            if future.done() and not future.cancelled():
+                self._tokens += 1
+            raise
+        self._stats["waited"] += time.monotonic() - started_at
+
+    def _dispatch(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self._burst, self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+        while self._waiters and self._tokens >= 1:
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            self._tokens -= 1
+            future.set_result(None)
+        if self._waiters and self._timer is None:
+            delay = (1 - self._tokens) / self._rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self):
+        self._timer = None
+        self._dispatch()
+
+
+class _TTLCache:
+    """有効期限付きのLRUキャッシュ"""
+
+    def __init__(self, ttl: float, max_size: int):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self._ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        self._entries.pop(key, None)
+
+
+class AsyncWorksheet:
+    """gspread.Worksheetの通信を伴う操作をスレッドプールで実行する"""
 
+    def __init__(
+        self,
+        worksheet: gspread.Worksheet,
+        scheduler: _RequestScheduler,
+        on_error: Optional[Callable[[], None]] = None,
+    ):
+        self._worksheet = worksheet
+        self._scheduler = scheduler
+        self._on_error = on_error
 
-def duplicate_template_sheet(
-    workbook: gspread.Spreadsheet, name: str
-) -> gspread.Worksheet:
-    template = workbook.worksheet("template")
-    return template.duplicate(new_sheet_name=name)
+    @property
+    def id(self) -> int:
+        return self._worksheet.id
+
+    @property
+    def title(self) -> str:
+        return self._worksheet.title
+
+    async def append_rows(self, values: List[List[Any]], **kwargs):
+        return await self._run(self._worksheet.append_rows, values, **kwargs)
+
+    async def get_values(self, range_name: str = None, **kwargs) -> List[List[Any]]:
+        return await self._run(
+            self._worksheet.get_values, range_name, idempotent=True, **kwargs
+        )
+
+    async def col_values(self, col: int, **kwargs) -> List[Any]:
+        return await self._run(
+            self._worksheet.col_values, col, idempotent=True, **kwargs
+        )
+
+    # 値の上書きと消去は何度実行しても結果が同じなのでリトライできる
+    async def update(self, range_name: str, values: List[List[Any]], **kwargs):
+        return await self._run(
+            self._worksheet.update, range_name, values, idempotent=True, **kwargs
+        )
+
+    async def batch_clear(self, ranges: List[str]):
+        return await self._run(self._worksheet.batch_clear, ranges, idempotent=True)
+
+    async def _run(
+        self, func: Callable, *args, idempotent: bool = False, **kwargs
+    ) -> Any:
+        try:
+            return await self._scheduler.run(
+                func, *args, idempotent=idempotent, **kwargs
+            )
+        except (gspread.exceptions.WorksheetNotFound, gspread.exceptions.APIError):
+            # シートが削除された場合などに古いハンドルを使い続けないようにする
+            if self._on_error is not None:
+                self._on_error()
+            raise
+
+
+class AsyncSpreadsheet:
+    """gspread.Spreadsheetの通信を伴う操作をスレッドプールで実行する"""
+
+    def __init__(self, workbook: gspread.Spreadsheet, scheduler: _RequestScheduler):
+        self._workbook = workbook
+        self._scheduler = scheduler
+
+    async def worksheets(
+        self, on_error: Optional[Callable[[str], None]] = None
+    ) -> List[AsyncWorksheet]:
+        """全てのシートを取得する ※on_errorにはエラーが発生したシートの名前が渡される"""
+        worksheets = await self._scheduler.run(
+            self._workbook.worksheets, idempotent=True
+        )
+        return [
+            AsyncWorksheet(
+                worksheet,
+                self._scheduler,
+                functools.partial(on_error, worksheet.title) if on_error else None,
+            )
+            for worksheet in worksheets
+        ]
+
+    async def values_batch_get(self, ranges: List[str]) -> dict:
+        return await self._scheduler.run(
+            self._workbook.values_batch_get, ranges, idempotent=True
+        )
+
+    async def get_or_add_worksheet(
+        self,
+        name: str,
+        template: Optional[str] = None,
+        cols: int = 100,
+        on_error: Optional[Callable[[], None]] = None,
+    ) -> AsyncWorksheet:
+        """nameのシートを取得し、無ければtemplateのシートを複製して追加する ※templateが無ければcols列の空のシート"""
+        # クォータはリクエスト毎に消費するので、取得と追加は別々に実行する
+        try:
+            worksheet = await self._scheduler.run(
+                self._workbook.worksheet, name, idempotent=True
+            )
+        except gspread.exceptions.WorksheetNotFound:
+            worksheet = await self._add_worksheet(name, template, cols)
+        return AsyncWorksheet(worksheet, self._scheduler, on_error)
+
+    async def _add_worksheet(
+        self, name: str, template: Optional[str], cols: int
+    ) -> gspread.Worksheet:
+        # 追加は処理済みの場合に重複して作成されるのでサーバーエラーではリトライしない
+        if template is None:
+            return await self._scheduler.run(
+                self._workbook.add_worksheet, name, rows=100, cols=cols
+            )
+        # 複製元の取得と複製で2回通信するので分けて実行する
+        source = await self._scheduler.run(
+            self._workbook.worksheet, template, idempotent=True
+        )
+        return await self._scheduler.run(source.duplicate, new_sheet_name=name)
 
 
 class GSpreadClient(Singleton):
     def __init__(self):
+        # Singletonなので初期化は一度だけ
+        if hasattr(self, "_gspread_client"):
+            return
         # 認証は生成時に一度だけ
         # TODO: 起動し続けていて認証エラーが出るようだったらそのときに対策を考える
         credentials = Credentials.from_service_account_file(
@@ -37,6 +334,111 @@ class GSpreadClient(Singleton):
             scopes=["https://www.googleapis.com/auth/spreadsheets"],
         )
         self._gspread_client = gspread.authorize(credentials)
+        # gspreadの通信は同期的なのでイベントループを止めないように別スレッドで実行する
+        executor = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("GSPREAD_MAX_WORKERS", "4")),
+            thread_name_prefix="gspread",
+        )
+        self._scheduler = _RequestScheduler(
+            executor,
+            quota_per_minute=int(os.environ.get("GSPREAD_QUOTA_PER_MINUTE", "60")),
+            burst=int(os.environ.get("GSPREAD_BURST", "10")),
+            max_retries=int(os.environ.get("GSPREAD_MAX_RETRIES", "5")),
+            max_backoff=float(os.environ.get("GSPREAD_MAX_BACKOFF", "64")),
+        )
+        # シートの取得だけで毎回通信しないようにハンドルを使い回す
+        ttl = float(os.environ.get("GSPREAD_CACHE_TTL", "600"))
+        max_size = int(os.environ.get("GSPREAD_CACHE_SIZE", "256"))
+        self._workbooks = _TTLCache(ttl, max_size)
+        self._worksheets = _TTLCache(ttl, max_size)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._warm_ups: Dict[str, asyncio.Future] = {}
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return self._scheduler.stats
+
+    async def warm_up(self, key: str, names: List[str]) -> Dict[str, List[List[Any]]]:
+        """namesのシートの値を1回のbatchGetでまとめて読み込む
+
+        同じスプレッドシートを同時に読み込む呼び出しは1回にまとめる ※先に始めた呼び出しのnamesが対象
+        存在するシートの値だけを返し、シートのハンドルはget_or_add_worksheet()で使い回せるようにキャッシュしておく
+        """
+        future = self._warm_ups.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._warm_up(key, list(names)))
+            self._warm_ups[key] = future
+            # 結果は保持し続けないように読み込みが終わったら手放す
+            future.add_done_callback(lambda _: self._warm_ups.pop(key, None))
+        # 呼び出し元がキャンセルされても他の呼び出し元のために読み込みは続ける
+        return await asyncio.shield(future)
+
+    async def _warm_up(self, key: str, names: List[str]) -> Dict[str, List[List[Any]]]:
+        started_at = time.monotonic()
+        workbook = await self.open_by_key(key)
+        worksheets = await workbook.worksheets(lambda name: self._invalidate(key, name))
+        # ハンドルは読み込むシートの分だけキャッシュする
+        titles = {worksheet.title: worksheet for worksheet in worksheets}
+        targets = [name for name in names if name in titles]
+        for name in targets:
+            self._worksheets.set((key, name), titles[name])
+
+        values: Dict[str, List[List[Any]]] = {}
+        if len(targets) > 0:
+            response = await workbook.values_batch_get(
+                [absolute_range_name(name) for name in targets]
+            )
+            # 結果はリクエストした順に返ってくる
+            for name, value_range in zip(targets, response["valueRanges"]):
+                values[name] = value_range.get("values", [])
+        logger.info(
+            f"warm up, key={key}, sheets={len(targets)}/{len(names)}, "
+            f"elapsed={time.monotonic() - started_at:.2f}s"
+        )
+        return values
+
+    async def open_by_key(self, key: str) -> AsyncSpreadsheet:
+        workbook = self._workbooks.get(key)
+        if workbook is None:
+            workbook = AsyncSpreadsheet(
+                await self._scheduler.run(
+                    self._gspread_client.open_by_key, key, idempotent=True
+                ),
+                self._scheduler,
+            )
+            self._workbooks.set(key, workbook)
+        return workbook
+
+    async def get_or_add_worksheet(
+        self,
+        key: str,
+        name: str,
+        template: Optional[str] = None,
+        cols: int = 100,
+    ) -> AsyncWorksheet:
+        cache_key = (key, name)
+        worksheet = self._worksheets.get(cache_key)
+        if worksheet is not None:
+            return worksheet
+
+        # 同じシートを同時に追加しないように取得はキー毎に1つずつ行う
+        if cache_key not in self._locks:
+            self._locks[cache_key] = asyncio.Lock()
+        async with self._locks[cache_key]:
+            worksheet = self._worksheets.get(cache_key)
+            if worksheet is not None:
+                return worksheet
+            workbook = await self.open_by_key(key)
+            try:
+                worksheet = await workbook.get_or_add_worksheet(
+                    name, template, cols, lambda: self._invalidate(key, name)
+                )
+            except gspread.exceptions.APIError:
+                self._invalidate(key, name)
+                raise
+            self._worksheets.set(cache_key, worksheet)
+            return worksheet
 
-    def open_by_key(self, key: str) -> gspread.Spreadsheet:
-        return self._gspread_client.open_by_key(key)
+    def _invalidate(self, key: str, name: str):
+        self._worksheets.pop((key, name))
+        self._workbooks.pop(key)
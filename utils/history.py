@@ -0,0 +1,125 @@
+import asyncio
+import datetime
+from typing import AsyncIterator, List, Optional, Tuple, Union
+
+import discord
+from discord.utils import time_snowflake
+
+
+def split_snowflake_range(lower: int, upper: int, slices: int) -> List[Tuple[int, int]]:
+    # (lower, upper)の範囲を時間で等分し、各区間の(after, before)を返す ※after/beforeは共に含まない
+    if slices <= 1 or upper - lower <= slices:
+        return [(lower, upper)]
+    boundaries = [lower + (upper - lower) * i // slices for i in range(1, slices)]
+    # 境界のIDちょうどのメッセージを取りこぼさないよう後ろの区間のafterは1つ手前にする
+    afters = [lower] + [boundary - 1 for boundary in boundaries]
+    befores = boundaries + [upper]
+    return list(zip(afters, befores))
+
+
+def to_snowflake(
+    value: Union[datetime.datetime, discord.abc.Snowflake], high: bool = False
+) -> int:
+    # channel.historyと同じくdatetimeとSnowflakeのどちらでも受け付ける
+    if isinstance(value, datetime.datetime):
+        return time_snowflake(value, high=high)
+    return value.id
+
+
+# 区間毎に先読みしておくメッセージの数 ※APIの1回の取得件数に合わせる
+_PREFETCH_SIZE = 100
+# 区間の取得が終わったことを表す
+_END = object()
+
+
+async def _fetch_window(
+    channel: discord.TextChannel,
+    after_id: int,
+    before_id: int,
+    oldest_first: bool,
+    queue: asyncio.Queue,
+):
+    # 出力する順番に取得し、キューが一杯になったら読み出されるまで取得を止める
+    try:
+        if oldest_first:
+            history = channel.history(
+                limit=None, after=discord.Object(id=after_id), oldest_first=True
+            )
+        else:
+            history = channel.history(
+                limit=None, before=discord.Object(id=before_id), oldest_first=False
+            )
+        async for message in history:
+            # 反対側の境界を越えてもチャンネルの端まで辿ってしまうので境界で打ち切る
+            if message.id >= before_id or message.id <= after_id:
+                break
+            await queue.put(message)
+    except Exception as e:
+        await queue.put(e)
+        return
+    await queue.put(_END)
+
+
+async def sliced_history(
+    channel: discord.TextChannel,
+    before: Optional[Union[datetime.datetime, discord.abc.Snowflake]],
+    after: Optional[Union[datetime.datetime, discord.abc.Snowflake]],
+    slices: int = 1,
+    oldest_first: Optional[bool] = None,
+) -> AsyncIterator[discord.Message]:
+    """channel.history(limit=None)を期間で分割して並行に取得する
+
+    before/afterはUTCのnaive datetimeかSnowflakeで指定する
+    並び順はchannel.historyと同じく、afterを指定した場合は古い順、それ以外は新しい順になる
+    先の区間は先読みした分だけを保持するので、メモリの使用量は区間数に比例する
+    """
+    if oldest_first is None:
+        oldest_first = after is not None
+
+    if slices <= 1:
+        # channel.historyは反対側の境界を越えてもチャンネルの端まで辿ってしまうので
+        # 取得の起点側の境界だけを渡し、反対側の境界は自前で打ち切る
+        before_id = to_snowflake(before) if before is not None else None
+        after_id = to_snowflake(after, high=True) if after is not None else None
+        if oldest_first:
+            history = channel.history(limit=None, after=after, oldest_first=True)
+        else:
+            history = channel.history(limit=None, before=before, oldest_first=False)
+        async for message in history:
+            if before_id is not None and message.id >= before_id:
+                break
+            if after_id is not None and message.id <= after_id:
+                break
+            yield message
+        return
+
+    # チャンネルより古いメッセージは無いのでafterの指定が無ければチャンネルのIDを下限にする
+    lower = to_snowflake(after, high=True) if after is not None else channel.id
+    if before is not None:
+        upper = to_snowflake(before)
+    else:
+        upper = time_snowflake(datetime.datetime.utcnow(), high=True)
+    windows = split_snowflake_range(lower, upper, slices)
+
+    if not oldest_first:
+        windows.reverse()
+    queues = [asyncio.Queue(maxsize=_PREFETCH_SIZE) for _ in windows]
+    tasks = [
+        asyncio.ensure_future(
+            _fetch_window(channel, after_id, before_id, oldest_first, queue)
+        )
+        for (after_id, before_id), queue in zip(windows, queues)
+    ]
+    try:
+        # 取得は並行して行い、出力は区間の順番に繋ぎ直す ※先の区間は先読みした分だけ保持する
+        for queue in queues:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import logging
+import sqlite3
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL,
+    row TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_key_seq ON events (key, seq);
+"""
+
+
+class Journal:
+    """到着した行をその場でローカルに記録する追記専用のジャーナル
+
+    WALモードでsynchronous=NORMALにしているので、書き込みの度にfsyncはせずチェックポイントでまとめて行う
+    送信済みの行は削除するので、残っている行がそのまま未送信の行になる
+    """
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        # 追記の度に数えないようにキー毎の未送信の行数をメモリ上で数えておく
+        self._counts: Dict[str, int] = dict(
+            self._connection.execute("SELECT key, COUNT(*) FROM events GROUP BY key")
+        )
+
+    def append(self, key: str, row: List[Any]):
+        self._connection.execute(
+            "INSERT INTO events (key, row) VALUES (?, ?)",
+            (key, json.dumps(row, ensure_ascii=False)),
+        )
+        self._connection.commit()
+        self._counts[key] = self._counts.get(key, 0) + 1
+
+    def count(self, key: str) -> int:
+        return self._counts.get(key, 0)
+
+    def keys(self) -> List[str]:
+        return [
+            row[0]
+            for row in self._connection.execute("SELECT DISTINCT key FROM events")
+        ]
+
+    def read(self, key: str, limit: int) -> List[Tuple[int, List[Any]]]:
+        cursor = self._connection.execute(
+            "SELECT seq, row FROM events WHERE key = ? ORDER BY seq LIMIT ?",
+            (key, limit),
+        )
+        return [(seq, json.loads(row)) for seq, row in cursor]
+
+    def acknowledge(self, key: str, last_seq: int):
+        # 送信済みの行を削除してチェックポイントとする
+        deleted = self._connection.execute(
+            "DELETE FROM events WHERE key = ? AND seq <= ?", (key, last_seq)
+        ).rowcount
+        self._connection.commit()
+        count = self._counts.get(key, 0) - deleted
+        if count > 0:
+            self._counts[key] = count
+        else:
+            self._counts.pop(key, None)
+
+    def close(self):
+        # WALの内容を本体に書き戻してから閉じる
+        self._connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self._connection.close()
+
+
+class JournalReplicator:
+    """ジャーナルの行をキー毎に記録順のまま送信する
+
+    一定間隔または未送信の行が一定件数溜まった時点で送信し、失敗した場合はそのキーの送信を次回に持ち越す
+    停止する際は残っている行の送信を試みてからジャーナルを閉じる
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        journal: Journal,
+        ship_func: Callable[[str, List[List[Any]]], Awaitable[None]],
+        interval: float,
+        batch_size: int,
+    ):
+        self._journal = journal
+        self._ship_func = ship_func
+        self._interval = interval
+        self._batch_size = batch_size
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    def notify(self, key: str):
+        if self._journal.count(key) >= self._batch_size:
+            self._wakeup.set()
+
+    def close(self):
+        self._task.cancel()
+
+    async def replicate(self):
+        # 送信中にキャンセルされても途中で止めずに最後まで実行させる
+        await asyncio.shield(self._replicate())
+
+    async def _replicate(self):
+        async with self._lock:
+            for key in self._journal.keys():
+                while True:
+                    events = self._journal.read(key, self._batch_size)
+                    if len(events) == 0:
+                        break
+                    try:
+                        await self._ship_func(key, [row for _, row in events])
+                    except Exception as e:
+                        logger.error(
+                            f"failed to replicate, key={key}, "
+                            f"rows={len(events)}, error={e}"
+                        )
+                        break
+                    self._journal.acknowledge(key, events[-1][0])
+                    logger.debug(f"replicate, key={key}, rows={len(events)}")
+
+    async def _run(self):
+        try:
+            while True:
+                # 起動時に前回の未送信分があれば送信する
+                await self.replicate()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self._interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+        finally:
+            try:
+                # 終了時に残っている行も送信を試みる
+                await self.replicate()
+            finally:
+                self._journal.close()
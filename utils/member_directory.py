@@ -0,0 +1,86 @@
+import logging
+from typing import Dict
+
+import discord
+
+from utils.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+
+class GuildMembers:
+    """サーバーの参加メンバーのスナップショット"""
+
+    __slots__ = ("ids", "names")
+
+    def __init__(self, members):
+        # BOT以外のメンバーのID ※guild.membersと同じ順番を保つようにdictのキーで持つ
+        self.ids: Dict[int, None] = {}
+        # {user_id: display_name} ※BOTも含む
+        self.names: Dict[int, str] = {}
+        for member in members:
+            self.add(member)
+
+    def add(self, member: discord.Member):
+        self.names[member.id] = member.display_name
+        if not member.bot:
+            self.ids[member.id] = None
+
+    def remove(self, user_id: int):
+        self.names.pop(user_id, None)
+        self.ids.pop(user_id, None)
+
+
+class MemberDirectory(Singleton):
+    """サーバー毎の参加メンバーを保持する
+
+    初回の参照時に1回だけguild.membersから作り、それ以降はメンバーのイベントで差分だけ更新する
+    メンバーの取得(chunk)が終わっていないサーバーは途中の状態を保持しないように毎回guild.membersから作る
+    """
+
+    def __init__(self):
+        # Singletonなので初期化は一度だけ
+        if hasattr(self, "_guilds"):
+            return
+        self._guilds: Dict[int, GuildMembers] = {}
+
+    def get(self, guild: discord.Guild) -> GuildMembers:
+        members = self._guilds.get(guild.id)
+        if members is None:
+            members = GuildMembers(guild.members)
+            if not guild.chunked:
+                logger.debug(f"guild is not chunked yet, guild={guild.id}")
+                return members
+            self._guilds[guild.id] = members
+            logger.debug(
+                f"load members, guild={guild.id}, "
+                f"members={len(members.names)}, non_bots={len(members.ids)}"
+            )
+        return members
+
+    def add(self, member: discord.Member):
+        # まだ作っていないサーバーは初回の参照時にまとめて作る
+        members = self._guilds.get(member.guild.id)
+        if members is not None:
+            members.add(member)
+
+    def remove(self, member: discord.Member):
+        members = self._guilds.get(member.guild.id)
+        if members is not None:
+            members.remove(member.id)
+
+    def rename(self, user_id: int, guilds):
+        # ユーザー名の変更はサーバー毎の表示名にも影響するので、参加しているサーバー全てに反映する
+        for guild in guilds:
+            members = self._guilds.get(guild.id)
+            if members is None or user_id not in members.names:
+                continue
+            member = guild.get_member(user_id)
+            if member is not None:
+                members.names[user_id] = member.display_name
+
+    def forget(self, guild_id: int):
+        self._guilds.pop(guild_id, None)
+
+    def clear(self):
+        self._guilds.clear()
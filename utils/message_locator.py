@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import re
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+_MESSAGE_LINK = re.compile(
+    r"https?://(?:\w+\.)?discord(?:app)?\.com/channels/(\d+)/(\d+)/(\d+)"
+)
+
+
+def parse_message_link(value: str) -> Optional[Tuple[int, int, int]]:
+    """メッセージリンクから(guild_id, channel_id, message_id)を取り出す ※リンクでなければNone"""
+    match = _MESSAGE_LINK.search(value)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2)), int(match.group(3))
+
+
+class MessageLocator:
+    """メッセージIDからメッセージのあるチャンネルを探す
+
+    受信したメッセージや過去に見つけたメッセージのチャンネルを覚えておき、分からない場合は最近発言のあったチャンネルから順に並行して探す
+    """
+
+    def __init__(self, cache_size: int, channel_size: int, concurrency: int):
+        self._cache_size = cache_size
+        self._channel_size = channel_size
+        self._concurrency = concurrency
+        # {message_id: channel_id}
+        self._messages: OrderedDict = OrderedDict()
+        # 最近発言のあったチャンネル ※末尾ほど新しい
+        self._channels: OrderedDict = OrderedDict()
+
+    def remember(self, message: discord.Message):
+        self._remember(message.id, message.channel.id)
+        self._channels[message.channel.id] = None
+        self._channels.move_to_end(message.channel.id)
+        while len(self._channels) > self._channel_size:
+            self._channels.popitem(last=False)
+
+    async def locate(
+        self, guild: discord.Guild, message_id: int, channel_id: Optional[int] = None
+    ) -> Tuple[Optional[discord.TextChannel], Optional[discord.Message]]:
+        # 指定されたチャンネル、覚えているチャンネルの順に探す
+        for hint in (channel_id, self._messages.get(message_id)):
+            if hint is None:
+                continue
+            channel = guild.get_channel(hint)
+            if not isinstance(channel, discord.TextChannel):
+                continue
+            message = await self._fetch(channel, message_id)
+            if message is not None:
+                self._remember(message_id, channel.id)
+                return channel, message
+
+        channels = self._sort_channels(guild)
+        for index in range(0, len(channels), self._concurrency):
+            end = index + self._concurrency
+            chunk = channels[index:end]
+            messages = await asyncio.gather(
+                *[self._fetch(channel, message_id) for channel in chunk]
+            )
+            for channel, message in zip(chunk, messages):
+                if message is not None:
+                    logger.debug(
+                        f"locate message, message={message_id}, "
+                        f"channel={channel.id}, probes={index + len(chunk)}"
+                    )
+                    self._remember(message_id, channel.id)
+                    return channel, message
+        return None, None
+
+    def _sort_channels(self, guild: discord.Guild) -> List[discord.TextChannel]:
+        # 最近発言のあったチャンネルを先頭にして、残りはサーバーのチャンネル順
+        recent = [
+            guild.get_channel(channel_id) for channel_id in reversed(self._channels)
+        ]
+        channels = [c for c in recent if isinstance(c, discord.TextChannel)]
+        recent_ids = {channel.id for channel in channels}
+        channels.extend(
+            c
+            for c in guild.channels
+            if isinstance(c, discord.TextChannel) and c.id not in recent_ids
+        )
+        return channels
+
+    def _remember(self, message_id: int, channel_id: int):
+        self._messages[message_id] = channel_id
+        self._messages.move_to_end(message_id)
+        while len(self._messages) > self._cache_size:
+            self._messages.popitem(last=False)
+
+    @staticmethod
+    async def _fetch(
+        channel: discord.TextChannel, message_id: int
+    ) -> Optional[discord.Message]:
+        try:
+            return await channel.fetch_message(message_id)
+        except (discord.NotFound, discord.Forbidden):
+            return None
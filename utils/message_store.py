@@ -0,0 +1,310 @@
+import asyncio
+import datetime
+import logging
+import os
+import sqlite3
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import discord
+from discord.utils import time_snowflake
+
+from utils.history import sliced_history
+from utils.singleton import Singleton
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    channel_id INTEGER NOT NULL,
+    author_id INTEGER NOT NULL,
+    author_name TEXT NOT NULL,
+    author_display_name TEXT NOT NULL,
+    author_bot INTEGER NOT NULL,
+    created_at TEXT NOT NULL,
+    edited_at TEXT,
+    content TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_channel_id_id ON messages (channel_id, id);
+CREATE TABLE IF NOT EXISTS synced_ranges (
+    channel_id INTEGER PRIMARY KEY,
+    after_id INTEGER NOT NULL,
+    before_id INTEGER NOT NULL
+);
+"""
+
+# Snowflakeの取りうる最大値
+_MAX_SNOWFLAKE = (1 << 63) - 1
+# 1度に読み書きするメッセージ数
+_BATCH_SIZE = 100
+
+_SELECT_MESSAGES = (
+    "SELECT id, channel_id, author_id, author_name, author_display_name,"
+    " author_bot, created_at, edited_at, content"
+    " FROM messages WHERE channel_id = ? AND ? < id AND id < ?"
+)
+
+
+def _to_iso(dt: Optional[datetime.datetime]) -> Optional[str]:
+    return dt.isoformat() if dt is not None else None
+
+
+def _from_iso(value: Optional[str]) -> Optional[datetime.datetime]:
+    return datetime.datetime.fromisoformat(value) if value is not None else None
+
+
+class StoredMessage:
+    """ローカルに保存したメッセージ ※日時はUTCのnaive datetime"""
+
+    __slots__ = (
+        "id",
+        "channel_id",
+        "author_id",
+        "author_name",
+        "author_display_name",
+        "author_bot",
+        "created_at",
+        "edited_at",
+        "content",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        channel_id: int,
+        author_id: int,
+        author_name: str,
+        author_display_name: str,
+        author_bot: bool,
+        created_at: datetime.datetime,
+        edited_at: Optional[datetime.datetime],
+        content: str,
+    ):
+        self.id = id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.author_name = author_name
+        self.author_display_name = author_display_name
+        self.author_bot = author_bot
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.content = content
+
+    def to_row(self) -> tuple:
+        return (
+            self.id,
+            self.channel_id,
+            self.author_id,
+            self.author_name,
+            self.author_display_name,
+            int(self.author_bot),
+            _to_iso(self.created_at),
+            _to_iso(self.edited_at),
+            self.content,
+        )
+
+    @classmethod
+    def from_row(cls, row: tuple):
+        return cls(
+            row[0],
+            row[1],
+            row[2],
+            row[3],
+            row[4],
+            bool(row[5]),
+            _from_iso(row[6]),
+            _from_iso(row[7]),
+            row[8],
+        )
+
+    @classmethod
+    def from_message(cls, message: discord.Message):
+        return cls(
+            message.id,
+            message.channel.id,
+            message.author.id,
+            message.author.name,
+            message.author.display_name,
+            # Webhookの投稿もBOTと同じく集計対象外にする
+            message.author.bot or message.webhook_id is not None,
+            message.created_at,
+            message.edited_at,
+            message.content,
+        )
+
+
+class MessageStore(Singleton):
+    """チャンネルの履歴をSQLiteに保存して、2回目以降は差分だけを取得する
+
+    チャンネル毎に保存済みの連続したSnowflakeの範囲を記録しておき、範囲外の部分だけをDiscordから取得する
+    BOTが起動していない間の編集と削除は反映できないので注意
+    MESSAGE_STORE_RETENTION_DAYSを指定すると、起動時にそれより古いメッセージを削除する
+    """
+
+    def __init__(self):
+        # Singletonなので初期化は一度だけ
+        if hasattr(self, "_connection"):
+            return
+        path = os.environ.get("MESSAGE_STORE_FILE", "message_store.sqlite3")
+        self._connection = sqlite3.connect(path)
+        self._connection.executescript(_SCHEMA)
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # 0なら削除しない
+        retention_days = int(os.environ.get("MESSAGE_STORE_RETENTION_DAYS", "0"))
+        if retention_days > 0:
+            # 取得中の範囲と食い違わないように、まだ同期が始まっていない起動時にだけ削除する
+            self._prune(
+                datetime.datetime.utcnow() - datetime.timedelta(days=retention_days)
+            )
+
+    async def sync(
+        self,
+        channel: discord.TextChannel,
+        before: Optional[datetime.datetime],
+        after: Optional[datetime.datetime],
+        slices: int = 1,
+    ):
+        lower = time_snowflake(after, high=True) if after is not None else channel.id
+        # 未来の日時まで同期済みにすると、その後に投稿されたメッセージを取得しなくなるので現在時刻までにする
+        now = time_snowflake(datetime.datetime.utcnow(), high=True)
+        upper = min(time_snowflake(before), now) if before is not None else now
+        if upper <= lower:
+            return
+
+        if channel.id not in self._locks:
+            self._locks[channel.id] = asyncio.Lock()
+        async with self._locks[channel.id]:
+            synced = self._get_synced_range(channel.id)
+            if synced is None:
+                await self._fetch(channel, lower, upper, slices)
+                self._set_synced_range(channel.id, lower, upper)
+                return
+
+            # 保存済みの範囲と繋がるように足りない部分だけを取得する
+            synced_after, synced_before = synced
+            if lower < synced_after:
+                await self._fetch(channel, lower, synced_after + 1, slices)
+                synced_after = lower
+            if synced_before < upper:
+                await self._fetch(channel, synced_before - 1, upper, slices)
+                synced_before = upper
+            self._set_synced_range(channel.id, synced_after, synced_before)
+
+    def count_by_author(
+        self,
+        channel_id: int,
+        before: Optional[datetime.datetime],
+        after: Optional[datetime.datetime],
+    ) -> List[Tuple[int, str, bool, int]]:
+        # 表示名は最も新しいメッセージのものを使う
+        cursor = self._connection.execute(
+            "SELECT author_id, author_display_name, author_bot, COUNT(*), MAX(id)"
+            " FROM messages WHERE channel_id = ? AND ? < id AND id < ?"
+            " GROUP BY author_id",
+            (channel_id, *self._to_range(before, after)),
+        )
+        return [(row[0], row[1], bool(row[2]), row[3]) for row in cursor]
+
+    async def iter_messages(
+        self,
+        channel_id: int,
+        before: Optional[datetime.datetime],
+        after: Optional[datetime.datetime],
+        oldest_first: bool = True,
+    ) -> AsyncIterator[StoredMessage]:
+        order = "ASC" if oldest_first else "DESC"
+        after_id, before_id = self._to_range(before, after)
+        while True:
+            # 処理を譲っている間に同期で書き込まれてもいいように、カーソルは開いたままにせず1ページずつ読み切る
+            rows = self._connection.execute(
+                f"{_SELECT_MESSAGES} ORDER BY id {order} LIMIT ?",
+                (channel_id, after_id, before_id, _BATCH_SIZE),
+            ).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                yield StoredMessage.from_row(row)
+            # 次のページは読み終えたメッセージの続きから
+            if oldest_first:
+                after_id = rows[-1][0]
+            else:
+                before_id = rows[-1][0]
+            # 件数が多くてもイベントループを止めないように一度処理を譲る
+            await asyncio.sleep(0)
+
+    def update_content(
+        self, message_id: int, content: str, edited_at: Optional[datetime.datetime]
+    ):
+        self._connection.execute(
+            "UPDATE messages SET content = ?, edited_at = COALESCE(?, edited_at)"
+            " WHERE id = ?",
+            (content, _to_iso(edited_at), message_id),
+        )
+        self._connection.commit()
+
+    def delete(self, message_ids: List[int]):
+        self._connection.executemany(
+            "DELETE FROM messages WHERE id = ?",
+            [(message_id,) for message_id in message_ids],
+        )
+        self._connection.commit()
+
+    async def _fetch(
+        self, channel: discord.TextChannel, after_id: int, before_id: int, slices: int
+    ):
+        logger.debug(f"fetch {channel} history, after={after_id}, before={before_id}")
+        rows = []
+        async for message in sliced_history(
+            channel,
+            discord.Object(id=before_id),
+            discord.Object(id=after_id),
+            slices,
+            oldest_first=True,
+        ):
+            rows.append(StoredMessage.from_message(message).to_row())
+            if len(rows) >= _BATCH_SIZE:
+                self._insert(rows)
+                rows.clear()
+        self._insert(rows)
+
+    def _insert(self, rows: List[tuple]):
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        self._connection.commit()
+
+    def _prune(self, before: datetime.datetime):
+        cutoff = time_snowflake(before)
+        deleted = self._connection.execute(
+            "DELETE FROM messages WHERE id <= ?", (cutoff,)
+        ).rowcount
+        # 保存済みの範囲も削除した分だけ縮める ※範囲の両端は含まない
+        self._connection.execute(
+            "DELETE FROM synced_ranges WHERE before_id <= ?", (cutoff + 1,)
+        )
+        self._connection.execute(
+            "UPDATE synced_ranges SET after_id = ? WHERE after_id < ?", (cutoff, cutoff)
+        )
+        self._connection.commit()
+        logger.info(f"prune messages, before={before}, deleted={deleted}")
+
+    def _get_synced_range(self, channel_id: int) -> Optional[Tuple[int, int]]:
+        return self._connection.execute(
+            "SELECT after_id, before_id FROM synced_ranges WHERE channel_id = ?",
+            (channel_id,),
+        ).fetchone()
+
+    def _set_synced_range(self, channel_id: int, after_id: int, before_id: int):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO synced_ranges VALUES (?, ?, ?)",
+            (channel_id, after_id, before_id),
+        )
+        self._connection.commit()
+
+    @staticmethod
+    def _to_range(
+        before: Optional[datetime.datetime], after: Optional[datetime.datetime]
+    ) -> Tuple[int, int]:
+        lower = time_snowflake(after, high=True) if after is not None else 0
+        upper = time_snowflake(before) if before is not None else _MAX_SNOWFLAKE
+        return lower, upper
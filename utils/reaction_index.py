@@ -0,0 +1,130 @@
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# (カスタム絵文字のID ※Unicode絵文字はNone, 絵文字の名前)
+EmojiKey = Tuple[Optional[int], str]
+
+
+def emoji_key(emoji: Union[discord.Emoji, discord.PartialEmoji, str]) -> EmojiKey:
+    if isinstance(emoji, str):
+        return None, emoji
+    return emoji.id, emoji.name
+
+
+class _Entry:
+    def __init__(self, message: discord.Message):
+        self.message = message
+        self.reactions: Dict[EmojiKey, Set[int]] = {}
+        # スナップショットを取っている間に届いたイベント ※取り終わったらNone
+        self.pending: Optional[List[Tuple[str, Optional[EmojiKey], Optional[int]]]] = []
+
+
+class ReactionIndex:
+    """監視しているメッセージの絵文字毎のリアクションしたユーザーを保持する
+
+    登録時に1回だけスナップショットを取り、それ以降はリアクションのイベントで更新するので通信せずに参照できる
+    監視するメッセージの数は上限を超えると使われていない順に破棄する
+    """
+
+    def __init__(self, size: int):
+        self._size = size
+        self._entries: OrderedDict = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._entries
+
+    async def watch(
+        self,
+        message: discord.Message,
+        snapshot: Callable[[], Awaitable[Dict[EmojiKey, Set[int]]]],
+    ) -> Dict[EmojiKey, Set[int]]:
+        """messageの監視を始めてスナップショットを返す ※監視済みであれば今の状態を返す"""
+        entry = self.get(message.id)
+        if entry is not None:
+            return entry.reactions
+
+        # スナップショットを取っている間のイベントも取りこぼさないように先に登録しておく
+        entry = _Entry(message)
+        self._entries[message.id] = entry
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+        try:
+            reactions = await snapshot()
+        except BaseException:
+            if self._entries.get(message.id) is entry:
+                del self._entries[message.id]
+            raise
+
+        # 取っている間に届いたイベントはスナップショットに含まれているか分からないので、届いた順に適用し直す
+        entry.reactions = reactions
+        pending, entry.pending = entry.pending, None
+        for event in pending:
+            self._apply(entry, *event)
+        logger.debug(
+            f"watch message, message={message.id}, "
+            f"reactions={len(reactions)}, pending={len(pending)}"
+        )
+        return entry.reactions
+
+    def unwatch(self, message_id: int):
+        self._entries.pop(message_id, None)
+
+    def get(self, message_id: int) -> Optional[_Entry]:
+        """スナップショットを取り終えている場合だけ返す"""
+        entry = self._entries.get(message_id)
+        if entry is None or entry.pending is not None:
+            return None
+        self._entries.move_to_end(message_id)
+        return entry
+
+    def add(self, message_id: int, key: EmojiKey, user_id: int):
+        self._push(message_id, "add", key, user_id)
+
+    def remove(self, message_id: int, key: EmojiKey, user_id: int):
+        self._push(message_id, "remove", key, user_id)
+
+    def clear(self, message_id: int):
+        self._push(message_id, "clear", None, None)
+
+    def clear_emoji(self, message_id: int, key: EmojiKey):
+        self._push(message_id, "clear_emoji", key, None)
+
+    def _push(
+        self,
+        message_id: int,
+        action: str,
+        key: Optional[EmojiKey],
+        user_id: Optional[int],
+    ):
+        entry = self._entries.get(message_id)
+        if entry is None:
+            return
+        if entry.pending is not None:
+            entry.pending.append((action, key, user_id))
+        else:
+            self._apply(entry, action, key, user_id)
+
+    @staticmethod
+    def _apply(
+        entry: _Entry, action: str, key: Optional[EmojiKey], user_id: Optional[int]
+    ):
+        if action == "add":
+            entry.reactions.setdefault(key, set()).add(user_id)
+        elif action == "remove":
+            users = entry.reactions.get(key)
+            if users is not None:
+                users.discard(user_id)
+                if len(users) == 0:
+                    del entry.reactions[key]
+        elif action == "clear":
+            entry.reactions.clear()
+        elif action == "clear_emoji":
+            entry.reactions.pop(key, None)